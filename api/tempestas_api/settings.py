@@ -104,6 +104,7 @@ DATABASES = {
         'NAME': os.getenv('SURFACE_DB_NAME'),
         'USER': os.getenv('SURFACE_DB_USER'),
         'PASSWORD': os.getenv('SURFACE_DB_PASSWORD'),
+        'CONN_MAX_AGE': int(os.getenv('SURFACE_DB_CONN_MAX_AGE', 0)),
     }
 }
 
@@ -111,6 +112,7 @@ SURFACE_CONNECTION_STRING = "dbname={0} user={1} password={2} host={3}".format(o
                                                                                os.getenv('SURFACE_DB_USER'),
                                                                                os.getenv('SURFACE_DB_PASSWORD'),
                                                                                os.getenv('SURFACE_DB_HOST'))
+SURFACE_DB_POOL_MAX = int(os.getenv('SURFACE_DB_POOL_MAX', 10))
 
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
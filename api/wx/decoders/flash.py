@@ -10,7 +10,7 @@ def get_int_from_bytes(bytes, signed=False):
     return int.from_bytes(bytes, byteorder='big', signed=signed)
 
 
-def read_data(byte_data):
+def parse_data(byte_data):
     if byte_data[0] == 56:
         type = FlashTypeEnum.CG.value if byte_data[1] == 0 else FlashTypeEnum.IC.value
         flash_timestamp = get_int_from_bytes(byte_data[2:6])
@@ -32,22 +32,33 @@ def read_data(byte_data):
         lr_latitude = get_int_from_bytes(byte_data[47:51], signed=True) / 1e7
         lr_longitude = get_int_from_bytes(byte_data[51:55], signed=True) / 1e7
 
-        print('LIGHTNING DATA - Flash data saved ({0}, {1}).'.format(latitude, longitude))
-
-        Flash.objects.create(type=type,
-                             datetime=flash_datetime,
-                             latitude=latitude,
-                             longitude=longitude,
-                             peak_current=peak_current,
-                             ic_height=ic_height,
-                             num_sensors=num_sensors,
-                             ic_multiplicity=ic_multiplicity,
-                             cg_multiplicity=cg_multiplicity,
-                             start_datetime=start_datetime,
-                             duration=duration,
-                             ul_latitude=ul_latitude,
-                             ul_longitude=ul_longitude,
-                             lr_latitude=lr_latitude,
-                             lr_longitude=lr_longitude)
+        return Flash(type=type,
+                     datetime=flash_datetime,
+                     latitude=latitude,
+                     longitude=longitude,
+                     peak_current=peak_current,
+                     ic_height=ic_height,
+                     num_sensors=num_sensors,
+                     ic_multiplicity=ic_multiplicity,
+                     cg_multiplicity=cg_multiplicity,
+                     start_datetime=start_datetime,
+                     duration=duration,
+                     ul_latitude=ul_latitude,
+                     ul_longitude=ul_longitude,
+                     lr_latitude=lr_latitude,
+                     lr_longitude=lr_longitude)
     else:
         print('LIGHTNING DATA - Error decoding flash data.')
+
+
+def read_data(byte_data):
+    flash = parse_data(byte_data)
+    if flash is not None:
+        flash.save()
+        print('LIGHTNING DATA - Flash data saved ({0}, {1}).'.format(flash.latitude, flash.longitude))
+
+
+def read_data_batch(byte_data_list):
+    flashes = [flash for flash in map(parse_data, byte_data_list) if flash is not None]
+    Flash.objects.bulk_create(flashes)
+    print('LIGHTNING DATA - {0} flash data saved.'.format(len(flashes)))
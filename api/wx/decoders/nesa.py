@@ -100,7 +100,8 @@ def parse_line(station_id, header_date, line, interval_lookup_table, records):
 def read_data(station_id, dcp_address, response, err_message):
     print(f'Inside NESA decoder - read_data(station_id={station_id}, dcp_address={dcp_address})')
 
-    transmissions = response.split(dcp_address)
+    # The LRGS response is split as bytes, only one transmission is decoded at a time
+    transmissions = response.split(dcp_address.encode('ascii'))
     records = []
 
     dcp_format = 6
@@ -112,6 +113,13 @@ def read_data(station_id, dcp_address, response, err_message):
     }
 
     for transmission in transmissions[1:]:
+        try:
+            transmission = transmission.decode('ascii')
+        except UnicodeDecodeError as ex:
+            logging.error(f"NESA/CDP Message: Error on decode message for station_id={station_id} "
+                          f"dcp_address={dcp_address}\n{ex}")
+            continue
+
         header, *lines = transmission.split(" \r\n")
 
         # code can't decode errors like missing transmission spot, soh skip error messages
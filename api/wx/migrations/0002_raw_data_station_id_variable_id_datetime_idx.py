@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # The index is built one hypertable chunk per transaction, so raw_data inserts are only blocked on the chunk
+    # being indexed instead of for the whole build
+    atomic = False
+
+    dependencies = [
+        ('wx', '0001_initial'),
+    ]
+
+    operations = [
+        # raw_data_datetime_station_id_variable_id_uidx leads with datetime, so the QC and summary queries that
+        # filter a few stations and variables over a time window scan every station of the window with it. This
+        # index lets them seek straight to each (station_id, variable_id) range, which outweighs the extra index
+        # write on every insert
+        migrations.RunSQL(
+            '''
+            CREATE INDEX IF NOT EXISTS raw_data_station_id_variable_id_datetime_idx
+                ON public.raw_data USING btree (station_id, variable_id, datetime)
+                WITH (timescaledb.transaction_per_chunk);
+            ''',
+            reverse_sql='''
+            DROP INDEX IF EXISTS public.raw_data_station_id_variable_id_datetime_idx;
+            '''
+        ),
+    ]
@@ -1,28 +1,43 @@
 from __future__ import absolute_import, unicode_literals
 
+import csv
 import hashlib
 import json
 import logging
 import os
 import socket
+import struct
 import subprocess
-from datetime import datetime, timedelta
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from functools import lru_cache
 from ftplib import FTP, error_perm, error_reply
-from time import sleep, time
+from time import monotonic, sleep, time
 
 import cronex
-import dateutil.parser
-import pandas
 import psycopg2
+import psycopg2.extensions
+import psycopg2.sql
 import pytz
 import requests
-from celery import shared_task
+from celery import group, shared_task
+from celery.signals import worker_process_init
 from celery.utils.log import get_task_logger
+from django.contrib.postgres.aggregates import ArrayAgg
 from django.core.cache import cache
-from django.db import connection
+from django.db import connection, transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from psycopg2.extras import Json
+from psycopg2.pool import ThreadedConnectionPool
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from tempestas_api import settings
 from wx.decoders.flash import read_data as read_data_flash
+from wx.decoders.flash import read_data_batch as read_data_flash_batch
 from wx.decoders.hobo import read_file as read_file_hobo
 from wx.decoders.hydro import read_file as read_file_hydrology
 from wx.decoders.manual_data import read_file as read_file_manual_data
@@ -35,14 +50,177 @@ from wx.models import Document
 from wx.models import NoaaDcp
 from wx.models import Station
 from wx.models import StationFileIngestion, StationDataFile, HourlySummaryTask, DailySummaryTask, \
-    HydroMLPredictionStation, HydroMLPredictionMapping
+    HydroMLPredictionStation, HydroMLPredictionMapping, StationNeighborhood
 
 logger = get_task_logger(__name__)
 db_logger = get_task_logger('db')
 
 
+_connection_pool = None
+
+
+class PreparedStatementConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that keeps track of the statements prepared in its session"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+
+def init_connection_pool():
+    global _connection_pool
+    _connection_pool = ThreadedConnectionPool(1, settings.SURFACE_DB_POOL_MAX, settings.SURFACE_CONNECTION_STRING,
+                                              connection_factory=PreparedStatementConnection)
+
+
+@worker_process_init.connect
+def init_worker_connection_pool(**kwargs):
+    # Connections can't be shared with the parent process, each worker process creates its own pool
+    init_connection_pool()
+
+
+@contextmanager
 def get_connection():
-    return psycopg2.connect(settings.SURFACE_CONNECTION_STRING)
+    if _connection_pool is None:
+        init_connection_pool()
+
+    conn = _connection_pool.getconn()
+    try:
+        yield conn
+    finally:
+        # Never give back a connection with an open transaction
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                conn.close()
+        _connection_pool.putconn(conn, close=bool(conn.closed))
+
+
+def prepare_statement(conn, name, sql):
+    """
+    Prepare a statement once per database session, pooled connections keep it between tasks
+
+    Parameters:
+        conn (PreparedStatementConnection): pooled connection
+        name (str): statement name, must match the one used in the PREPARE sql
+        sql (str): PREPARE statement
+
+    """
+    if name not in conn.prepared_statements:
+        with conn.cursor() as cursor:
+            cursor.execute(sql)
+        conn.prepared_statements.add(name)
+
+
+@lru_cache(maxsize=256)
+def get_day_bounds(offset, start_date, end_date):
+    """
+    Get the UTC datetimes of the midnights that start start_date and end_date at a UTC offset
+
+    Parameters:
+        offset (int): UTC offset in minutes
+        start_date (date): first day
+        end_date (date): last day
+
+    """
+    fixed_offset = pytz.FixedOffset(offset)
+
+    datetime_start = datetime(start_date.year, start_date.month, start_date.day, 0, 0, 0,
+                              tzinfo=fixed_offset).astimezone(pytz.UTC)
+    datetime_end = datetime(end_date.year, end_date.month, end_date.day, 0, 0, 0,
+                            tzinfo=fixed_offset).astimezone(pytz.UTC)
+
+    return datetime_start, datetime_end
+
+
+# Hourly buckets are computed for the whole [start_datetime, end_datetime) window in a single pass
+HOURLY_SUMMARY_SELECT_SQL = """
+    PREPARE hourly_summary_select (timestamptz, timestamptz, integer[], double precision) AS
+    SELECT 
+        values.datetime,
+        values.station_id,
+        values.variable_id,
+        values.min_value,
+        values.max_value,
+        values.avg_value,
+        values.sum_value,
+        values.num_records
+    FROM
+        (SELECT 
+            CASE WHEN NOT rd.is_daily AND rd.datetime = rd.datetime::date THEN date_trunc('hour', rd.datetime - '1 second'::interval) ELSE date_trunc('hour', rd.datetime) END as datetime,
+            station_id,
+            variable_id,
+            min(calc.value) AS min_value,
+            max(calc.value) AS max_value,
+            avg(calc.value) AS avg_value,
+            sum(calc.value) AS sum_value,
+            count(calc.value) AS num_records
+        FROM 
+            raw_data rd
+            ,LATERAL (SELECT CASE WHEN rd.consisted IS NOT NULL THEN rd.consisted ELSE rd.measured END as value) AS calc
+        WHERE rd.datetime >= $1
+          AND rd.datetime <= $2
+          AND (rd.manual_flag in (1,4) OR (rd.manual_flag IS NULL AND rd.quality_flag in (1,4)))
+          AND calc.value != $4
+          AND station_id = ANY($3)
+        GROUP BY 1,2,3) values
+    WHERE values.datetime >= $1
+      AND values.datetime < $2
+"""
+
+# Only summaries that no longer have data are deleted, the others are updated in place
+HOURLY_SUMMARY_DELETE_SQL = """
+    DELETE FROM hourly_summary hs
+    WHERE hs.station_id = ANY(%(station_ids)s) 
+      AND hs.datetime >= %(start_datetime)s
+      AND hs.datetime < %(end_datetime)s
+      AND NOT EXISTS (SELECT 1 
+                      FROM hourly_summary_stage stage 
+                      WHERE stage.datetime = hs.datetime 
+                        AND stage.station_id = hs.station_id 
+                        AND stage.variable_id = hs.variable_id)
+"""
+
+HOURLY_SUMMARY_UPSERT_SQL = """
+    INSERT INTO hourly_summary (
+        datetime,
+        station_id,
+        variable_id,
+        min_value,
+        max_value,
+        avg_value,
+        sum_value,
+        num_records,
+        created_at,
+        updated_at
+    )
+    SELECT 
+        stage.datetime,
+        stage.station_id,
+        stage.variable_id,
+        stage.min_value,
+        stage.max_value,
+        stage.avg_value,
+        stage.sum_value,
+        stage.num_records,
+        now(),
+        now()
+    FROM hourly_summary_stage stage
+    ON CONFLICT (datetime, station_id, variable_id) DO
+    UPDATE SET
+        min_value = excluded.min_value,
+        max_value = excluded.max_value,
+        avg_value = excluded.avg_value,
+        sum_value = excluded.sum_value,
+        num_records = excluded.num_records,
+        updated_at = excluded.updated_at
+    WHERE (hourly_summary.min_value, hourly_summary.max_value, hourly_summary.avg_value,
+           hourly_summary.sum_value, hourly_summary.num_records)
+          IS DISTINCT FROM
+          (excluded.min_value, excluded.max_value, excluded.avg_value,
+           excluded.sum_value, excluded.num_records)
+"""
 
 
 @shared_task
@@ -50,20 +228,16 @@ def calculate_hourly_summary(start_datetime=None, end_datetime=None, station_id_
     start_at = time()
 
     if not start_datetime:
-        start_datetime = datetime.today() - timedelta(hours=48)
+        start_datetime = datetime.now(pytz.UTC) - timedelta(hours=48)
 
     if not end_datetime:
-        end_datetime = datetime.today()
+        end_datetime = datetime.now(pytz.UTC)
 
-    if start_datetime.tzinfo is None:
-        start_datetime = pytz.UTC.localize(start_datetime)
-
-    if end_datetime.tzinfo is None:
-        end_datetime = pytz.UTC.localize(end_datetime)
+    if start_datetime.tzinfo is None or end_datetime.tzinfo is None:
+        raise ValueError('Pass timezone-aware datetimes.')
 
     if start_datetime > end_datetime:
-        print('Error - start date is more recent than end date.')
-        return
+        raise ValueError('start date is more recent than end date.')
 
     if station_id_list is None:
         station_ids = Station.objects.filter(is_active=True).values_list('id', flat=True)
@@ -72,105 +246,178 @@ def calculate_hourly_summary(start_datetime=None, end_datetime=None, station_id_
 
     station_ids = tuple(station_ids)
 
+    if not station_ids:
+        logger.info('No active stations')
+        return
+
     logger.info('Hourly summary started at {}'.format(datetime.today()))
     logger.info('Hourly summary parameters: {} {} {}'.format(start_datetime, end_datetime, station_id_list))
 
-    delete_sql = f"""
-        DELETE FROM hourly_summary 
-        WHERE station_id in %(station_ids)s 
-          AND datetime = %(start_datetime)s
+    params = {"station_ids": list(station_ids), "start_datetime": start_datetime, "end_datetime": end_datetime,
+              "MISSING_VALUE": settings.MISSING_VALUE}
+
+    with get_connection() as conn, conn.cursor() as cursor:
+        prepare_statement(conn, 'hourly_summary_select', HOURLY_SUMMARY_SELECT_SQL)
+        cursor.execute("""
+            CREATE TEMP TABLE hourly_summary_stage ON COMMIT DROP AS
+            EXECUTE hourly_summary_select (%(start_datetime)s, %(end_datetime)s, %(station_ids)s, %(MISSING_VALUE)s)
+        """, params)
+        # hourly_summary is only locked from here on, the aggregation above runs against raw_data alone
+        cursor.execute('ANALYZE hourly_summary_stage')
+        cursor.execute(HOURLY_SUMMARY_DELETE_SQL, params)
+        cursor.execute(HOURLY_SUMMARY_UPSERT_SQL)
+        conn.commit()
+
+    logger.info(f'Hourly summary finished at {datetime.now(pytz.UTC)}. Took {time() - start_at} seconds.')
+
+
+DAILY_SUMMARY_SELECT_SQL = """
+    PREPARE daily_summary_select (timestamptz, timestamptz, integer[], integer, double precision) AS
+    SELECT 
+        cast((rd.datetime + make_interval(mins => $4)) at time zone 'utc' - '1 second'::interval as DATE) as "date",
+        station_id,
+        variable_id,
+        min(calc.value) AS min_value,
+        max(calc.value) AS max_value,
+        avg(calc.value) AS avg_value,
+        sum(calc.value) AS sum_value,
+        count(calc.value) AS num_records
+    FROM 
+        raw_data rd
+        ,LATERAL (SELECT CASE WHEN rd.consisted IS NOT NULL THEN rd.consisted ELSE rd.measured END as value) AS calc
+    WHERE rd.datetime > $1
+      AND rd.datetime <= $2
+      AND calc.value != $5
+      AND station_id = ANY($3)
+      AND (rd.manual_flag in (1,4) OR (rd.manual_flag IS NULL AND rd.quality_flag in (1,4)))
+      AND NOT rd.is_daily
+    GROUP BY 1,2,3
+    UNION ALL
+    SELECT 
+        cast((rd.datetime + make_interval(mins => $4)) at time zone 'utc' as DATE) as "date",
+        station_id,
+        variable_id,
+        min(calc.value) AS min_value,
+        max(calc.value) AS max_value,
+        avg(calc.value) AS avg_value,
+        sum(calc.value) AS sum_value,
+        count(calc.value) AS num_records
+    FROM 
+        raw_data rd
+        ,LATERAL (SELECT CASE WHEN rd.consisted IS NOT NULL THEN rd.consisted ELSE rd.measured END as value) AS calc
+    WHERE rd.datetime > $1
+      AND rd.datetime <= $2
+      AND calc.value != $5
+      AND station_id = ANY($3)
+      AND (rd.manual_flag in (1,4) OR (rd.manual_flag IS NULL AND rd.quality_flag in (1,4)))
+      AND rd.is_daily
+    GROUP BY 1,2,3
+"""
+
+DAILY_SUMMARY_DELETE_SQL = """
+    DELETE FROM daily_summary ds
+    WHERE ds.station_id = ANY(%(station_ids)s) 
+      AND ds.day >= %(datetime_start)s
+      AND ds.day < %(datetime_end)s
+      AND NOT EXISTS (SELECT 1 
+                      FROM daily_summary_stage stage 
+                      WHERE stage.date = ds.day 
+                        AND stage.station_id = ds.station_id 
+                        AND stage.variable_id = ds.variable_id)
+"""
+
+DAILY_SUMMARY_UPSERT_SQL = """
+    INSERT INTO daily_summary (
+        "day",
+        station_id,
+        variable_id,
+        min_value,
+        max_value,
+        avg_value,
+        sum_value,
+        num_records,
+        created_at,
+        updated_at
+    )
+    SELECT 
+        stage.date,
+        stage.station_id,
+        stage.variable_id,
+        stage.min_value,
+        stage.max_value,
+        stage.avg_value,
+        stage.sum_value,
+        stage.num_records,
+        now(),
+        now()
+    FROM daily_summary_stage stage
+    ON CONFLICT (day, station_id, variable_id) DO
+    UPDATE SET
+        min_value = excluded.min_value,
+        max_value = excluded.max_value,
+        avg_value = excluded.avg_value,
+        sum_value = excluded.sum_value,
+        num_records = excluded.num_records,
+        updated_at = excluded.updated_at
+    WHERE (daily_summary.min_value, daily_summary.max_value, daily_summary.avg_value,
+           daily_summary.sum_value, daily_summary.num_records)
+          IS DISTINCT FROM
+          (excluded.min_value, excluded.max_value, excluded.avg_value,
+           excluded.sum_value, excluded.num_records)
+"""
+
+
+def get_station_ids_by_offset(station_id_list=None):
     """
+    Group station ids by UTC offset, each offset covers a disjoint set of stations
+
+    Parameters:
+        station_id_list (list): station ids, all active stations if None
 
-    insert_sql = f"""
-        INSERT INTO hourly_summary (
-            datetime,
-            station_id,
-            variable_id,
-            min_value,
-            max_value,
-            avg_value,
-            sum_value,
-            num_records,
-            created_at,
-            updated_at
-        )
-        SELECT 
-            values.datetime,
-            values.station_id,
-            values.variable_id,
-            values.min_value,
-            values.max_value,
-            values.avg_value,
-            values.sum_value,
-            values.num_records,
-            now(),
-            now()
-        FROM
-            (SELECT 
-                CASE WHEN rd.datetime = rd.datetime::date THEN date_trunc('hour', rd.datetime - '1 second'::interval) ELSE date_trunc('hour', rd.datetime) END as datetime,
-                station_id,
-                variable_id,
-                min(calc.value) AS min_value,
-                max(calc.value) AS max_value,
-                avg(calc.value) AS avg_value,
-                sum(calc.value) AS sum_value,
-                count(calc.value) AS num_records
-            FROM 
-                raw_data rd
-                ,LATERAL (SELECT CASE WHEN rd.consisted IS NOT NULL THEN rd.consisted ELSE rd.measured END as value) AS calc
-            WHERE rd.datetime >= %(start_datetime)s
-              AND rd.datetime <= %(end_datetime)s
-              AND (rd.manual_flag in (1,4) OR (rd.manual_flag IS NULL AND rd.quality_flag in (1,4)))
-              AND NOT rd.is_daily
-              AND calc.value != %(MISSING_VALUE)s
-              AND station_id in %(station_ids)s
-            GROUP BY 1,2,3) values
-        WHERE values.datetime = %(start_datetime)s
-        UNION ALL
-        SELECT 
-            values.datetime,
-            values.station_id,
-            values.variable_id,
-            values.min_value,
-            values.max_value,
-            values.avg_value,
-            values.sum_value,
-            values.num_records,
-            now(),
-            now()
-        FROM
-            (SELECT date_trunc('hour', rd.datetime) as datetime,
-                station_id,
-                variable_id,
-                min(calc.value) AS min_value,
-                max(calc.value) AS max_value,
-                avg(calc.value) AS avg_value,
-                sum(calc.value) AS sum_value,
-                count(calc.value) AS num_records
-            FROM 
-                raw_data rd
-                ,LATERAL (SELECT CASE WHEN rd.consisted IS NOT NULL THEN rd.consisted ELSE rd.measured END as value) AS calc
-            WHERE rd.datetime >= %(start_datetime)s
-              AND rd.datetime <= %(end_datetime)s
-              AND (rd.manual_flag in (1,4) OR (rd.manual_flag IS NULL AND rd.quality_flag in (1,4)))
-              AND rd.is_daily
-              AND calc.value != %(MISSING_VALUE)s
-              AND station_id in %(station_ids)s
-            GROUP BY 1,2,3) values
-        WHERE values.datetime = %(start_datetime)s
     """
+    if station_id_list is None:
+        stations = Station.objects.filter(is_active=True)
+    else:
+        stations = Station.objects.filter(id__in=station_id_list)
 
-    conn = get_connection()
+    station_ids_by_offset = defaultdict(list)
+    for station_id, utc_offset_minutes in stations.values_list('id', 'utc_offset_minutes'):
+        station_ids_by_offset[utc_offset_minutes].append(station_id)
 
-    with conn.cursor() as cursor:
-        cursor.execute(delete_sql, {"station_ids": station_ids, "start_datetime": start_datetime})
-        cursor.execute(insert_sql,
-                       {"station_ids": station_ids, "start_datetime": start_datetime, "end_datetime": end_datetime,
-                        "MISSING_VALUE": settings.MISSING_VALUE})
-    conn.commit()
-    conn.close()
+    return station_ids_by_offset
 
-    logger.info(f'Hourly summary finished at {datetime.now(pytz.UTC)}. Took {time() - start_at} seconds.')
+
+def summarize_daily_offset(offset, station_ids, start_date, end_date):
+    start_at = time()
+
+    station_ids = tuple(station_ids)
+    if not station_ids:
+        return
+
+    with get_connection() as conn, conn.cursor() as cursor:
+        datetime_start_utc, datetime_end_utc = get_day_bounds(0, start_date, end_date)
+        datetime_start, datetime_end = get_day_bounds(offset, start_date, end_date)
+
+        logger.info(f"datetime_start={datetime_start}, datetime_end={datetime_end} "
+                    f"offset={offset} "
+                    f"station_ids={station_ids}")
+
+        prepare_statement(conn, 'daily_summary_select', DAILY_SUMMARY_SELECT_SQL)
+        cursor.execute("""
+            CREATE TEMP TABLE daily_summary_stage ON COMMIT DROP AS
+            EXECUTE daily_summary_select (%(datetime_start)s, %(datetime_end)s, %(station_ids)s, %(offset)s,
+                                          %(MISSING_VALUE)s)
+        """, {"datetime_start": datetime_start, "datetime_end": datetime_end, "station_ids": list(station_ids),
+              "offset": offset, "MISSING_VALUE": settings.MISSING_VALUE})
+        cursor.execute('ANALYZE daily_summary_stage')
+        cursor.execute(DAILY_SUMMARY_DELETE_SQL, {"datetime_start": datetime_start_utc, "datetime_end": datetime_end_utc,
+                                                  "station_ids": list(station_ids)})
+        cursor.execute(DAILY_SUMMARY_UPSERT_SQL)
+
+        conn.commit()
+
+    logger.info(f'Daily summary for offset {offset} finished at {datetime.now(pytz.UTC)}. '
+                f'Took {time() - start_at} seconds.')
 
 
 @shared_task
@@ -179,118 +426,25 @@ def calculate_daily_summary(start_date=None, end_date=None, station_id_list=None
                 f'start_date={start_date} end_date={end_date} '
                 f'station_id_list={station_id_list}')
 
-    start_at = time()
-
     if start_date is None or end_date is None:
         start_date = datetime.now(pytz.UTC).date()
         end_date = (datetime.now(pytz.UTC) + timedelta(days=1)).date()
 
     if start_date > end_date:
-        print('Error - start_date is more recent than end_date.')
-        return
-
-    conn = get_connection()
-    with conn.cursor() as cursor:
-
-        if station_id_list is None:
-            stations = Station.objects.filter(is_active=True)
-        else:
-            stations = Station.objects.filter(id__in=station_id_list)
-
-        offsets = list(set([s.utc_offset_minutes for s in stations]))
-        for offset in offsets:
-            station_ids = tuple(stations.filter(utc_offset_minutes=offset).values_list('id', flat=True))
-            fixed_offset = pytz.FixedOffset(offset)
-
-            datetime_start_utc = datetime(start_date.year, start_date.month, start_date.day, 0, 0, 0, tzinfo=pytz.UTC)
-            datetime_end_utc = datetime(end_date.year, end_date.month, end_date.day, 0, 0, 0, tzinfo=pytz.UTC)
-
-            datetime_start = datetime(start_date.year, start_date.month, start_date.day, 0, 0, 0,
-                                      tzinfo=fixed_offset).astimezone(pytz.UTC)
-            datetime_end = datetime(end_date.year, end_date.month, end_date.day, 0, 0, 0,
-                                    tzinfo=fixed_offset).astimezone(pytz.UTC)
-
-            logger.info(f"datetime_start={datetime_start}, datetime_end={datetime_end} "
-                        f"offset={offset} "
-                        f"station_ids={station_ids}")
+        raise ValueError('start_date is more recent than end_date.')
 
-            delete_sql = """
-                DELETE FROM daily_summary 
-                WHERE station_id in %(station_ids)s 
-                AND day >= %(datetime_start)s
-                AND day < %(datetime_end)s
-            """
+    offset_tasks = [calculate_daily_summary_for_offset.s(offset, station_ids, start_date.isoformat(),
+                                                         end_date.isoformat())
+                    for offset, station_ids in get_station_ids_by_offset(station_id_list).items()]
 
-            insert_sql = """
-                INSERT INTO daily_summary (
-                    "day",
-                    station_id,
-                    variable_id,
-                    min_value,
-                    max_value,
-                    avg_value,
-                    sum_value,
-                    num_records,
-                    created_at,
-                    updated_at
-                )
-                SELECT 
-                    cast((rd.datetime + interval '%(offset)s minutes') at time zone 'utc' - '1 second'::interval as DATE) as "date",
-                    station_id,
-                    variable_id,
-                    min(calc.value) AS min_value,
-                    max(calc.value) AS max_value,
-                    avg(calc.value) AS avg_value,
-                    sum(calc.value) AS sum_value,
-                    count(calc.value) AS num_records,
-                    now(),
-                    now()
-                FROM 
-                    raw_data rd
-                    ,LATERAL (SELECT CASE WHEN rd.consisted IS NOT NULL THEN rd.consisted ELSE rd.measured END as value) AS calc
-                WHERE rd.datetime > %(datetime_start)s
-                  AND rd.datetime <= %(datetime_end)s
-                  AND calc.value != %(MISSING_VALUE)s
-                  AND station_id in %(station_ids)s
-                  AND (rd.manual_flag in (1,4) OR (rd.manual_flag IS NULL AND rd.quality_flag in (1,4)))
-                  AND NOT rd.is_daily
-                GROUP BY 1,2,3
-                UNION ALL
-                SELECT 
-                    cast((rd.datetime + interval '%(offset)s minutes') at time zone 'utc' as DATE) as "date",
-                    station_id,
-                    variable_id,
-                    min(calc.value) AS min_value,
-                    max(calc.value) AS max_value,
-                    avg(calc.value) AS avg_value,
-                    sum(calc.value) AS sum_value,
-                    count(calc.value) AS num_records,
-                    now(),
-                    now()
-                FROM 
-                    raw_data rd
-                    ,LATERAL (SELECT CASE WHEN rd.consisted IS NOT NULL THEN rd.consisted ELSE rd.measured END as value) AS calc
-                WHERE rd.datetime > %(datetime_start)s
-                  AND rd.datetime <= %(datetime_end)s
-                  AND calc.value != %(MISSING_VALUE)s
-                  AND station_id in %(station_ids)s
-                  AND (rd.manual_flag in (1,4) OR (rd.manual_flag IS NULL AND rd.quality_flag in (1,4)))
-                  AND rd.is_daily
-                GROUP BY 1,2,3
-            """
-
-            cursor.execute(delete_sql, {"datetime_start": datetime_start_utc, "datetime_end": datetime_end_utc,
-                                        "station_ids": station_ids})
-            cursor.execute(insert_sql,
-                           {"datetime_start": datetime_start, "datetime_end": datetime_end, "station_ids": station_ids,
-                            "offset": offset, "MISSING_VALUE": settings.MISSING_VALUE})
-            conn.commit()
+    if offset_tasks:
+        group(offset_tasks).apply_async()
 
-    conn.commit()
-    conn.close()
 
+@shared_task
+def calculate_daily_summary_for_offset(offset, station_ids, start_date, end_date):
+    summarize_daily_offset(offset, station_ids, date.fromisoformat(start_date), date.fromisoformat(end_date))
     cache.set('daily_summary_last_run', datetime.today(), None)
-    logger.info(f'Daily summary finished at {datetime.now(pytz.UTC)}. Took {time() - start_at} seconds.')
 
 
 @shared_task
@@ -306,29 +460,20 @@ def calculate_station_minimum_interval(start_date=None, end_date=None, station_i
         end_date = (datetime.now(pytz.UTC) + timedelta(days=1)).date()
 
     if start_date > end_date:
-        print('Error - start_date is more recent than end_date.')
-        return
+        raise ValueError('start_date is more recent than end_date.')
 
-    conn = get_connection()
-    with conn.cursor() as cursor:
+    with get_connection() as conn, conn.cursor() as cursor:
 
-        if station_id_list is None:
-            stations = Station.objects.filter(is_active=True)
-        else:
-            stations = Station.objects.filter(id__in=station_id_list)
+        station_ids_by_offset = get_station_ids_by_offset(station_id_list)
 
-        offsets = list(set([s.utc_offset_minutes for s in stations]))
-        for offset in offsets:
-            station_ids = tuple(stations.filter(utc_offset_minutes=offset).values_list('id', flat=True))
-            fixed_offset = pytz.FixedOffset(offset)
+        datetime_start_utc, datetime_end_utc = get_day_bounds(0, start_date, end_date)
 
-            datetime_start_utc = datetime(start_date.year, start_date.month, start_date.day, 0, 0, 0, tzinfo=pytz.UTC)
-            datetime_end_utc = datetime(end_date.year, end_date.month, end_date.day, 0, 0, 0, tzinfo=pytz.UTC)
+        for offset, station_ids_list in station_ids_by_offset.items():
+            station_ids = tuple(station_ids_list)
+            if not station_ids:
+                continue
 
-            datetime_start = datetime(start_date.year, start_date.month, start_date.day, 0, 0, 0,
-                                      tzinfo=fixed_offset).astimezone(pytz.UTC)
-            datetime_end = datetime(end_date.year, end_date.month, end_date.day, 0, 0, 0,
-                                    tzinfo=fixed_offset).astimezone(pytz.UTC)
+            datetime_start, datetime_end = get_day_bounds(offset, start_date, end_date)
 
             logger.info(f"datetime_start={datetime_start}, datetime_end={datetime_end} "
                         f"offset={offset} "
@@ -357,18 +502,16 @@ def calculate_station_minimum_interval(start_date=None, end_date=None, station_i
                       ,now()
                 FROM generate_series(%(datetime_start)s , %(datetime_end)s , INTERVAL '1 day') as current_day
                     ,wx_stationvariable as stationvariable
-                    ,wx_station as station
                 LEFT JOIN LATERAL (
-                    SELECT date_trunc('day', rd.datetime - INTERVAL '1 second' + (COALESCE(station.utc_offset_minutes, 0)||' minutes')::interval) as formated_datetime
+                    SELECT date_trunc('day', rd.datetime - INTERVAL '1 second' + make_interval(mins => %(offset_minutes)s)) as formated_datetime
                           ,CASE WHEN rd.is_daily THEN '24:00:00' ELSE LEAD(datetime, 1) OVER (partition by station_id, variable_id order by datetime) - datetime END as data_interval
                     FROM raw_data rd
-                    WHERE rd.datetime   > current_day - ((COALESCE(station.utc_offset_minutes, 0)||' minutes')::interval)
-                      AND rd.datetime   <= current_day + INTERVAL '1 DAY' - ((COALESCE(station.utc_offset_minutes, 0)||' minutes')::interval)
+                    WHERE rd.datetime   > current_day - make_interval(mins => %(offset_minutes)s)
+                      AND rd.datetime   <= current_day + INTERVAL '1 DAY' - make_interval(mins => %(offset_minutes)s)
                       AND rd.station_id  = stationvariable.station_id
                       AND rd.variable_id = stationvariable.variable_id
                 ) value ON TRUE
                 WHERE stationvariable.station_id IN %(station_ids)s
-                  AND stationvariable.station_id = station.id
                   AND (value.formated_datetime = current_day OR value.formated_datetime is null)
                 GROUP BY current_day, stationvariable.station_id, stationvariable.variable_id
                   ON CONFLICT (datetime, station_id, variable_id)
@@ -381,27 +524,22 @@ def calculate_station_minimum_interval(start_date=None, end_date=None, station_i
             """
             cursor.execute(insert_minimum_data_interval,
                            {"datetime_start": datetime_start_utc, "datetime_end": datetime_end_utc,
-                            "station_ids": station_ids})
+                            "station_ids": station_ids, "offset_minutes": offset})
             conn.commit()
 
-    conn.commit()
-    conn.close()
-
     logger.info(f'Calculate minimum interval finished at {datetime.now(pytz.UTC)}. Took {time() - start_at} seconds.')
 
 
 @shared_task
 def calculate_last24h_summary():
-    print('Last 24h summary started at {}'.format(datetime.today()))
+    logger.info('Last 24h summary started at %s', datetime.today())
 
-    conn = get_connection()
-
-    with conn.cursor() as cursor:
+    with get_connection() as conn, conn.cursor() as cursor:
         sql_delete = "DELETE FROM last24h_summary"
-        print(sql_delete)
+        logger.debug(sql_delete)
         cursor.execute(sql_delete)
 
-        sql_insert = f"""
+        sql_insert = """
             INSERT INTO last24h_summary (
                 datetime,
                 station_id,
@@ -413,62 +551,34 @@ def calculate_last24h_summary():
                 num_records,
                 latest_value
             )
-            WITH last AS (
-                SELECT
-                    datetime,
-                    station_id,
-                    variable_id,
-                    latest_value
-                FROM
-                    (SELECT 
-                        datetime,
-                        station_id,
-                        variable_id,
-                        calc.value AS latest_value,
-                        row_number() over (partition by station_id, variable_id order by datetime desc) as rownum
-                    FROM 
-                        raw_data rd
-                        ,LATERAL (SELECT CASE WHEN rd.consisted IS NOT NULL THEN rd.consisted ELSE rd.measured END as value) AS calc
-                    WHERE datetime > (now() - interval '1 day')
-                    AND datetime <= now()
-                    AND (rd.consisted IS NOT NULL OR quality_flag in (1, 4))
-                    AND measured != {settings.MISSING_VALUE}
-                    AND is_daily = false) AS latest
-                WHERE
-                    rownum = 1
-            ),
-            agg AS (
+            WITH base AS (
                 SELECT 
                     station_id,
                     variable_id,
-                    min(calc.value) AS min_value,
-                    max(calc.value) AS max_value,
-                    avg(calc.value) AS avg_value,
-                    sum(calc.value) AS sum_value,
-                    count(calc.value) AS num_records
+                    calc.value,
+                    row_number() over (partition by station_id, variable_id order by datetime desc) as rownum
                 FROM 
                     raw_data rd
                     ,LATERAL (SELECT CASE WHEN rd.consisted IS NOT NULL THEN rd.consisted ELSE rd.measured END as value) AS calc
                 WHERE datetime >  (now() - interval '1 day')
                   AND datetime <= now()
                   AND (rd.consisted IS NOT NULL OR quality_flag in (1, 4))
-                  AND calc.value != {settings.MISSING_VALUE}
+                  AND calc.value != %(MISSING_VALUE)s
                   AND is_daily = false
-                GROUP BY 1,2
             )
             SELECT
                 now(),
-                agg.station_id,
-                agg.variable_id,
-                agg.min_value,
-                agg.max_value,
-                agg.avg_value,
-                agg.sum_value,
-                agg.num_records,
-                last.latest_value
+                station_id,
+                variable_id,
+                min(value) AS min_value,
+                max(value) AS max_value,
+                avg(value) AS avg_value,
+                sum(value) AS sum_value,
+                count(value) AS num_records,
+                max(value) FILTER (WHERE rownum = 1) AS latest_value
             FROM
-                agg
-                JOIN last ON agg.station_id = last.station_id AND agg.variable_id = last.variable_id
+                base
+            GROUP BY 2,3
             ON CONFLICT (station_id, variable_id) DO
             UPDATE SET
                 min_value = excluded.min_value,
@@ -479,179 +589,171 @@ def calculate_last24h_summary():
                 latest_value = excluded.latest_value,
                 datetime = excluded.datetime;
         """
-        print(sql_insert)
-        cursor.execute(sql_insert)
+        logger.debug(sql_insert)
+        cursor.execute(sql_insert, {"MISSING_VALUE": settings.MISSING_VALUE})
 
-    conn.commit()
-    conn.close()
+        conn.commit()
 
     cache.set('last24h_summary_last_run', datetime.today(), None)
-    print('Last 24h summary finished at {}'.format(datetime.today()))
+    logger.info('Last 24h summary finished at %s', datetime.today())
 
 
 @shared_task
 def calculate_step_qc_test():
-    print('Inside calculate_step_qc_test')
-
-    conn = get_connection()
+    logger.debug('Inside calculate_step_qc_test')
 
-    with conn.cursor() as cursor:
-        cursor.execute(f'''
-        DO $$DECLARE rec record;
-        BEGIN
-            FOR rec in
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute('''
+            WITH step AS (
                 SELECT value.station_id
                       ,value.variable_id
                       ,value.datetime
-                      ,COALESCE(ABS(value.measured - LAG(value.measured,1) OVER (PARTITION BY value.station_id, value.variable_id ORDER BY value.station_id, value.variable_id, value.datetime)), 0) step_result
+                      ,COALESCE(ABS(value.measured - LAG(value.measured,1) OVER (PARTITION BY value.station_id, value.variable_id ORDER BY value.datetime)), 0) step_result
                       ,station_var.test_step_value
-                      ,value.qc_persist_quality_flag
                 FROM raw_data as value
-                LEFT JOIN wx_stationvariable station_var ON value.variable_id=station_var.variable_id and value.station_id=station_var.station_id
+                INNER JOIN wx_stationvariable station_var ON value.variable_id=station_var.variable_id and value.station_id=station_var.station_id
                 WHERE station_var.test_step_value IS NOT NULL
-            LOOP
-                IF rec.step_result > rec.test_step_value THEN
-                    IF rec.qc_persist_quality_flag = 2 THEN -- SUSPICIOUS
-                        UPDATE raw_data
-                        SET qc_step_quality_flag = 2
-                           ,quality_flag = false
-                           ,qc_step_description = FORMAT('The current step "%s" is bigger than the registered step value for this station and variable "%s".', rec.step_result,  rec.test_step_value)
-                        WHERE rec.station_id  = station_id
-                          AND rec.variable_id = variable_id
-                          AND rec.datetime = datetime;
-                    ELSE
-                        UPDATE raw_data
-                        SET qc_step_quality_flag = 2 -- SUSPICIOUS
-                           ,qc_step_description = FORMAT('The current step "%s" is bigger than the registered step value for this station and variable "%s".', rec.step_result,  rec.test_step_value)
-                        WHERE rec.station_id  = station_id
-                          AND rec.variable_id = variable_id
-                          AND rec.datetime = datetime;
-                    END IF;
-                ELSE
-                    UPDATE raw_data
-                    SET qc_step_quality_flag = 4
-                       ,qc_step_description = FORMAT('The current step "%s" is smaller than the registered step value for this station and variable "%s".', rec.step_result,  rec.test_step_value)
-                    WHERE rec.station_id  = station_id
-                      AND rec.variable_id = variable_id
-                      AND rec.datetime = datetime;
-                END IF;
-            END LOOP;
-
+            )
             UPDATE raw_data as value
-            SET qc_step_quality_flag = 1
-               ,qc_step_description = NULL
-            WHERE not exists (select 1 from wx_stationvariable station_var where station_var.variable_id = value.variable_id and station_var.station_id = value.station_id);
-
+            SET qc_step_quality_flag = CASE WHEN step.step_result > step.test_step_value THEN 2 -- SUSPICIOUS
+                                            ELSE 4 END -- GOOD
+               ,quality_flag = CASE WHEN step.step_result > step.test_step_value AND value.qc_persist_quality_flag = 2 THEN 3 -- BAD
+                                    ELSE value.quality_flag END
+               ,qc_step_description = CASE WHEN step.step_result > step.test_step_value
+                                           THEN FORMAT('The current step "%s" is bigger than the registered step value for this station and variable "%s".', step.step_result, step.test_step_value)
+                                           ELSE FORMAT('The current step "%s" is smaller than the registered step value for this station and variable "%s".', step.step_result, step.test_step_value) END
+            FROM step
+            WHERE value.station_id  = step.station_id
+              AND value.variable_id = step.variable_id
+              AND value.datetime    = step.datetime;
+
+            -- Records without a station variable or without a registered limit are reset in a single scan
             UPDATE raw_data as value
             SET qc_step_quality_flag = 1
                ,qc_step_description = NULL
-            FROM wx_stationvariable station_var
-            WHERE station_var.variable_id = value.variable_id
-              AND station_var.station_id  = value.station_id
-              AND station_var.test_step_value IS NULL;
-        END$$;
+            WHERE NOT EXISTS (SELECT 1
+                              FROM wx_stationvariable station_var
+                              WHERE station_var.variable_id = value.variable_id
+                                AND station_var.station_id  = value.station_id
+                                AND station_var.test_step_value IS NOT NULL)
+              AND (value.qc_step_quality_flag IS DISTINCT FROM 1 OR value.qc_step_description IS NOT NULL);
         ''')
 
-    conn.commit()
-
-    conn.close()
+        conn.commit()
 
 
 @shared_task
 def calculate_persist_qc_test():
-    print('Inside calculate_persist_qc_test')
+    logger.debug('Inside calculate_persist_qc_test')
 
-    conn = get_connection()
-
-    with conn.cursor() as cursor:
-        cursor.execute(f'''
-        DO $$DECLARE rec record;
-        BEGIN
-            FOR rec in
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute('''
+            WITH variance AS (
                 SELECT value.station_id
                       ,value.variable_id
                       ,value.datetime
-                      ,COALESCE((select VARIANCE(past24hvalue.measured) from raw_data as past24hvalue where value.station_id=past24hvalue.station_id and value.variable_id=past24hvalue.variable_id and past24hvalue.datetime < value.datetime and past24hvalue.datetime >= value.datetime - INTERVAL '1 day'),0) current_variance
+                      ,COALESCE(VARIANCE(value.measured) OVER (PARTITION BY value.station_id, value.variable_id ORDER BY value.datetime RANGE BETWEEN INTERVAL '1 day' PRECEDING AND INTERVAL '1 microsecond' PRECEDING), 0) current_variance
                       ,station_var.test_persistence_variance
                 FROM raw_data as value
                 INNER JOIN wx_stationvariable station_var ON value.variable_id=station_var.variable_id and value.station_id=station_var.station_id
                 WHERE station_var.test_persistence_variance IS NOT NULL
-                ORDER BY value.station_id, value.variable_id, value.datetime
-            LOOP
-                IF rec.current_variance > rec.test_persistence_variance THEN
-                    UPDATE raw_data as past24hvalue
-                    SET qc_persist_quality_flag = 2
-                       ,qc_persist_description = FORMAT('This record belongs to a 24h series that result on a variance "%s" bigger than registered for this station and variable "%s".', rec.current_variance,  rec.test_persistence_variance)
-                    WHERE rec.station_id  = past24hvalue.station_id
-                      AND rec.variable_id = past24hvalue.variable_id
-                      AND rec.datetime > past24hvalue.datetime
-                      AND past24hvalue.datetime > rec.datetime - INTERVAL '1 day';
-                ELSE
-                    UPDATE raw_data
-                    SET qc_persist_quality_flag = 4
-                       ,qc_persist_description = FORMAT('This record belongs to a 24h series that result on a variance "%s" smaller than registered for this station and variable "%s".', rec.current_variance,  rec.test_persistence_variance)
-                    WHERE rec.station_id  = station_id
-                      AND rec.variable_id = variable_id
-                      AND rec.datetime = datetime;
-                END IF;
-            END LOOP;
-
-
+            ),
+            persist AS (
+                -- A record is suspicious when any record in the following 24h has a past 24h variance above the limit
+                SELECT variance.*
+                      ,MAX(variance.current_variance) FILTER (WHERE variance.current_variance > variance.test_persistence_variance) OVER (PARTITION BY variance.station_id, variance.variable_id ORDER BY variance.datetime RANGE BETWEEN INTERVAL '1 microsecond' FOLLOWING AND INTERVAL '23:59:59.999999' FOLLOWING) series_variance
+                FROM variance
+            )
             UPDATE raw_data as value
-            SET qc_persist_quality_flag = 1
-               ,qc_persist_description = NULL
-            WHERE not exists (select 1 from wx_stationvariable station_var where station_var.variable_id = value.variable_id and station_var.station_id = value.station_id);
-
+            SET qc_persist_quality_flag = CASE WHEN persist.series_variance IS NOT NULL THEN 2 -- SUSPICIOUS
+                                               ELSE 4 END -- GOOD
+               ,qc_persist_description = CASE WHEN persist.series_variance IS NOT NULL
+                                              THEN FORMAT('This record belongs to a 24h series that result on a variance "%s" bigger than registered for this station and variable "%s".', persist.series_variance, persist.test_persistence_variance)
+                                              ELSE FORMAT('This record belongs to a 24h series that result on a variance "%s" smaller than registered for this station and variable "%s".', persist.current_variance, persist.test_persistence_variance) END
+            FROM persist
+            WHERE value.station_id  = persist.station_id
+              AND value.variable_id = persist.variable_id
+              AND value.datetime    = persist.datetime
+              AND (persist.series_variance IS NOT NULL OR persist.current_variance <= persist.test_persistence_variance);
+
+            -- Records without a station variable or without a registered limit are reset in a single scan
             UPDATE raw_data as value
             SET qc_persist_quality_flag = 1
                ,qc_persist_description = NULL
-            FROM wx_stationvariable station_var
-            WHERE station_var.variable_id = value.variable_id
-              AND station_var.station_id  = value.station_id
-              AND station_var.test_persistence_variance IS NULL;
-        END$$;
+            WHERE NOT EXISTS (SELECT 1
+                              FROM wx_stationvariable station_var
+                              WHERE station_var.variable_id = value.variable_id
+                                AND station_var.station_id  = value.station_id
+                                AND station_var.test_persistence_variance IS NOT NULL)
+              AND (value.qc_persist_quality_flag IS DISTINCT FROM 1 OR value.qc_persist_description IS NOT NULL);
         ''')
 
-    conn.commit()
-
-    conn.close()
+        conn.commit()
 
 
 @shared_task
 def process_document():
-    available_decoders = {
-        'HOBO': read_file_hobo,
-        'TOA5': read_file,
-        'HYDROLOGY': read_file_hydrology
-        # Nesa
-    }
+    document_ids = list(Document.objects.filter(processed=False).order_by('id').values_list('id', flat=True)[:60])
+
+    if not document_ids:
+        return
+
+    logger.info('Documents: %s', document_ids)
+
+    group(process_single_document.s(document_id) for document_id in document_ids).apply_async()
 
-    default_decoder = 'TOA5'
 
-    document_list = Document.objects.select_related('decoder', 'station').filter(processed=False).order_by('id')[:60]
+# Documents are locked while decoded, a later process_document run can select them again before they are processed
+DOCUMENT_LOCK_TIMEOUT = 3600
 
-    logger.info('Documents: %s' % document_list)
 
-    for document in document_list:
+@shared_task
+def process_single_document(document_id):
+    lock_key = f'process_document_{document_id}'
+    if not cache.add(lock_key, True, DOCUMENT_LOCK_TIMEOUT):
+        logger.info(f'Document {document_id} is already being processed.')
+        return
+
+    try:
+        available_decoders = {
+            'HOBO': read_file_hobo,
+            'TOA5': read_file,
+            'HYDROLOGY': read_file_hydrology
+            # Nesa
+        }
+
+        default_decoder = 'TOA5'
+
+        document = Document.objects.select_related('decoder', 'station').get(pk=document_id)
+
+        if document.processed:
+            return
+
         if document.decoder:
             current_decoder = available_decoders[document.decoder.name]
         else:
             current_decoder = available_decoders[default_decoder]
 
-        logger.info('Processing file "{0}" with "{1}" decoder.'.format(document.file.path, current_decoder))
+        document_path = document.file.path
+
+        logger.info('Processing file "{0}" with "{1}" decoder.'.format(document_path, current_decoder))
 
         try:
-            current_decoder(document.file.path, document.station)
+            current_decoder(document_path, document.station)
         except Exception as err:
             logger.error(
-                'Error Processing file "{0}" with "{1}" decoder. '.format(document.file.path, current_decoder) + repr(
-                    err))
+                'Error Processing file "{0}" with "{1}" decoder. '.format(document_path, current_decoder) + repr(err))
             db_logger.error(
-                'Error Processing file "{0}" with "{1}" decoder. '.format(document.file.path, current_decoder) + repr(
-                    err))
+                'Error Processing file "{0}" with "{1}" decoder. '.format(document_path, current_decoder) + repr(err))
         else:
             document.processed = True
-            document.save()
+            document.save(update_fields=['processed', 'updated_at'])
+    finally:
+        cache.delete(lock_key)
+
+
+# Concurrent LRGS requests of dcp_tasks_scheduler
+LRGS_MAX_WORKERS = 4
 
 
 @shared_task
@@ -659,6 +761,7 @@ def dcp_tasks_scheduler():
     logger.info('Inside dcp_tasks_scheduler')
 
     noaa_list_to_process = []
+    changed_noaa_dcps = []
     for noaaDcp in NoaaDcp.objects.all():
         now = pytz.UTC.localize(datetime.now())
 
@@ -681,13 +784,25 @@ def dcp_tasks_scheduler():
         if next_execution <= now and (noaaDcp.last_datetime is None or noaaDcp.last_datetime < next_execution):
             noaa_list_to_process.append({"noaa_object": noaaDcp, "last_execution": noaaDcp.last_datetime})
             noaaDcp.last_datetime = now
-            noaaDcp.save()
+            noaaDcp.updated_at = timezone.now()
+            changed_noaa_dcps.append(noaaDcp)
 
-    for noaa_dcp in noaa_list_to_process:
-        try:
-            retrieve_dpc_messages(noaa_dcp)
-        except Exception as e:
-            logging.error(f'dcp_tasks_scheduler ERROR: {repr(e)}')
+    with transaction.atomic():
+        NoaaDcp.objects.bulk_update(changed_noaa_dcps, ['last_datetime', 'updated_at'], batch_size=500)
+
+    # Each dcp has its own search criteria file, so the LRGS requests run concurrently
+    with ThreadPoolExecutor(max_workers=LRGS_MAX_WORKERS) as executor:
+        executor.map(retrieve_dpc_messages_in_thread, noaa_list_to_process)
+
+
+def retrieve_dpc_messages_in_thread(noaa_dict):
+    try:
+        retrieve_dpc_messages(noaa_dict)
+    except Exception as e:
+        logging.error(f'dcp_tasks_scheduler ERROR: {repr(e)}')
+    finally:
+        # Django opens a database connection per thread
+        connection.close()
 
 
 def retrieve_dpc_messages(noaa_dict):
@@ -696,14 +811,14 @@ def retrieve_dpc_messages(noaa_dict):
 
     logger.info('Inside retrieve_dpc_messages ' + current_noaa_dcp.dcp_address)
 
-    related_stations = current_noaa_dcp.noaadcpsstation_set
-    related_stations_count = related_stations.count()
-    if related_stations_count == 0:
+    # Two rows are enough to tell if the dcp is related to exactly one Station
+    related_stations = list(current_noaa_dcp.noaadcpsstation_set.select_related('decoder')[:2])
+    if len(related_stations) == 0:
         raise Exception(f"The noaa dcp '{current_noaa_dcp}' is not related to any Station.")
-    elif related_stations_count != 1:
+    elif len(related_stations) != 1:
         raise Exception(f"The noaa dcp '{current_noaa_dcp}' is related to more than one Station.")
 
-    noaa_dcp_station = related_stations.first()
+    noaa_dcp_station = related_stations[0]
     station_id = noaa_dcp_station.station_id
     decoder = noaa_dcp_station.decoder.name
 
@@ -711,32 +826,37 @@ def retrieve_dpc_messages(noaa_dict):
         'NESA': read_data_nesa,
     }
 
-    set_search_criteria(current_noaa_dcp, last_execution)
+    cs_file_path = set_search_criteria(current_noaa_dcp, last_execution)
 
-    command = subprocess.Popen([settings.LRGS_EXECUTABLE_PATH,
-                                '-h', settings.LRGS_SERVER_HOST,
-                                '-p', settings.LRGS_SERVER_PORT,
-                                '-u', settings.LRGS_USER,
-                                '-P', settings.LRGS_PASSWORD,
-                                '-f', settings.LRGS_CS_FILE_PATH
-                                ], shell=False, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+    try:
+        command = subprocess.Popen([settings.LRGS_EXECUTABLE_PATH,
+                                    '-h', settings.LRGS_SERVER_HOST,
+                                    '-p', settings.LRGS_SERVER_PORT,
+                                    '-u', settings.LRGS_USER,
+                                    '-P', settings.LRGS_PASSWORD,
+                                    '-f', cs_file_path
+                                    ], shell=False, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+
+        output, err_message = command.communicate()
+    finally:
+        os.remove(cs_file_path)
 
-    output, err_message = command.communicate()
-    response = output.decode('ascii')
     try:
-        available_decoders[decoder](station_id, current_noaa_dcp.dcp_address, response, err_message)
+        available_decoders[decoder](station_id, current_noaa_dcp.dcp_address, output, err_message)
     except Exception as err:
         logger.error(f'Error on retrieve_dpc_messages for dcp address "{current_noaa_dcp.dcp_address}". {repr(err)}')
 
 
 def set_search_criteria(dcp, last_execution):
-    with open(settings.LRGS_CS_FILE_PATH, 'w') as cs_file:
+    cs_file_path = f'{settings.LRGS_CS_FILE_PATH}.{dcp.dcp_address}'
+    with open(cs_file_path, 'w') as cs_file:
         if dcp.first_channel is not None:
             cs_file.write(
                 f"""DRS_SINCE: now - {dcp_query_window(last_execution)} hour\nDRS_UNTIL: now\nDCP_ADDRESS: {dcp.dcp_address}\nCHANNEL: |{dcp.first_channel}\n""")
         else:
             cs_file.write(
                 f"""DRS_SINCE: now - {dcp_query_window(last_execution)} hour\nDRS_UNTIL: now\nDCP_ADDRESS: {dcp.dcp_address}\n""")
+    return cs_file_path
 
 
 def dcp_query_window(last_execution):
@@ -750,6 +870,49 @@ def latest_received_dpc_data_in_hours(last_execution):
         return 999999
 
 
+ENTL_PACKET_SIZE = 56
+
+# Big-endian signed latitude and longitude of an ENTLN flash packet, starting at byte 10
+ENTL_LATITUDE_LONGITUDE = struct.Struct('>ii')
+
+ENTL_FLASH_BATCH_SIZE = 100
+
+ENTL_KEEP_ALIVE_TYPE = 9
+
+
+def frame_entl_packets(buffer):
+    """
+    Split the complete ENTLN packets at the start of buffer, the first byte of a packet is its length and the
+    second one its type
+
+    Parameters:
+        buffer (bytearray): received data, the framed bytes are removed from it
+
+    """
+    packets = []
+    skipped = 0
+    offset = 0
+    while offset + 1 < len(buffer):
+        length, packet_type = buffer[offset], buffer[offset + 1]
+        if length < 2 or (packet_type != ENTL_KEEP_ALIVE_TYPE and length != ENTL_PACKET_SIZE):
+            # Not the start of a known packet, bytes are dropped until the stream is aligned again
+            skipped += 1
+            offset += 1
+            continue
+
+        if offset + length > len(buffer):
+            break
+
+        packets.append(bytes(buffer[offset:offset + length]))
+        offset += length
+
+    if skipped:
+        print('LIGHTNING DATA - Dropped {0} bytes of unknown data.'.format(skipped))
+
+    del buffer[:offset]
+    return packets
+
+
 @shared_task
 def get_entl_data():
     print('LIGHTNING DATA - Starting get_entl_data task...')
@@ -759,6 +922,8 @@ def get_entl_data():
                 print("LIGHTNING DATA - Connecting to ENTLN server: {}:{}".format(settings.ENTL_PRIMARY_SERVER_HOST,
                                                                                   settings.ENTL_PRIMARY_SERVER_PORT))
 
+                # Set before connecting so the TCP window is negotiated with the larger buffer
+                entl_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
                 entl_socket.connect((settings.ENTL_PRIMARY_SERVER_HOST, settings.ENTL_PRIMARY_SERVER_PORT))
                 entl_socket.settimeout(60)
                 entl_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
@@ -782,18 +947,35 @@ def get_entl_data():
 
 
 def process_received_data(entl_socket):
-    while True:
-        data = entl_socket.recv(56)
-        if not data:
-            return
+    # Flashes are sent to be saved in batches, at most ENTL_FLASH_BATCH_SIZE packets or one second apart
+    flash_batch = []
+    last_flush = monotonic()
+    # Many packets are read per recv call, an incomplete packet at the end is kept for the next one
+    buffer = bytearray()
+    try:
+        while True:
+            received = entl_socket.recv(ENTL_PACKET_SIZE * 64)
+            if not received:
+                return
 
-        if data[1] == '9':
-            print("LIGHTNING DATA - Keep alive packet")
-        else:
-            latitude = int.from_bytes(data[10:14], byteorder='big', signed=True) / 1e7
-            longitude = int.from_bytes(data[14:18], byteorder='big', signed=True) / 1e7
-            if (15 <= latitude <= 19 and -90 <= longitude <= -87):
-                save_flash_data.delay(data.decode('latin-1'))
+            buffer += received
+
+            for packet in frame_entl_packets(buffer):
+                if packet[1] == ENTL_KEEP_ALIVE_TYPE:
+                    print("LIGHTNING DATA - Keep alive packet")
+                else:
+                    # Coordinates are compared in 1e-7 degrees, as sent by ENTLN
+                    latitude, longitude = ENTL_LATITUDE_LONGITUDE.unpack_from(packet, 10)
+                    if (150000000 <= latitude <= 190000000 and -900000000 <= longitude <= -870000000):
+                        flash_batch.append(packet.decode('latin-1'))
+
+            if flash_batch and (len(flash_batch) >= ENTL_FLASH_BATCH_SIZE or monotonic() - last_flush > 1):
+                save_flash_data_batch.delay(flash_batch)
+                flash_batch = []
+                last_flush = monotonic()
+    finally:
+        if flash_batch:
+            save_flash_data_batch.delay(flash_batch)
 
 
 # Used to save Flash data asynchronously
@@ -802,13 +984,22 @@ def save_flash_data(data_string):
     read_data_flash(data_string.encode('latin-1'))
 
 
+@shared_task
+def save_flash_data_batch(data_strings):
+    read_data_flash_batch([data_string.encode('latin-1') for data_string in data_strings])
+
+
+EXPORT_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
 @shared_task
 def export_data(station_id, source, start_date, end_date, variable_ids, file_id):
     logger.info(f'Exporting data (file "{file_id}")')
 
-    timezone_offset = pytz.timezone(settings.TIMEZONE_NAME)
-    start_date_utc = pytz.UTC.localize(datetime.strptime(start_date, '%Y-%m-%d %H:%M:%S'))
-    end_date_utc = pytz.UTC.localize(datetime.strptime(end_date, '%Y-%m-%d %H:%M:%S'))
+    # Dates are sent as '%Y-%m-%d %H:%M:%S' strings, which fromisoformat parses
+    start_date_utc = pytz.UTC.localize(datetime.fromisoformat(start_date))
+    end_date_utc = pytz.UTC.localize(datetime.fromisoformat(end_date))
+    export_timezone = pytz.timezone(settings.TIMEZONE_NAME)
 
     station = Station.objects.get(pk=station_id)
     current_datafile = DataFile.objects.get(pk=file_id)
@@ -837,8 +1028,8 @@ def export_data(station_id, source, start_date, end_date, variable_ids, file_id)
             datetime_variable = 'day'
             data_source_description = 'Daily summary'
             date_source = "day::date"
-            converted_start_date = start_date_utc.astimezone(timezone_offset).date()
-            converted_end_date = end_date_utc.astimezone(timezone_offset).date()
+            converted_start_date = start_date_utc.astimezone(export_timezone).date()
+            converted_end_date = end_date_utc.astimezone(export_timezone).date()
         elif source == 'monthly_summary':
             measured_source = '''
                 CASE WHEN var.sampling_operation_id in (1,2) THEN data.avg_value::real
@@ -849,8 +1040,8 @@ def export_data(station_id, source, start_date, end_date, variable_ids, file_id)
             datetime_variable = 'date'
             date_source = "date::date"
             data_source_description = 'Monthly summary'
-            converted_start_date = start_date_utc.astimezone(timezone_offset).date()
-            converted_end_date = end_date_utc.astimezone(timezone_offset).date()
+            converted_start_date = start_date_utc.astimezone(export_timezone).date()
+            converted_end_date = end_date_utc.astimezone(export_timezone).date()
         elif source == 'yearly_summary':
             measured_source = '''
                 CASE WHEN var.sampling_operation_id in (1,2) THEN data.avg_value::real
@@ -861,14 +1052,17 @@ def export_data(station_id, source, start_date, end_date, variable_ids, file_id)
             datetime_variable = 'date'
             date_source = "date::date"
             data_source_description = 'Yearly summary'
-            converted_start_date = start_date_utc.astimezone(timezone_offset).date()
-            converted_end_date = end_date_utc.astimezone(timezone_offset).date()
+            converted_start_date = start_date_utc.astimezone(export_timezone).date()
+            converted_end_date = end_date_utc.astimezone(export_timezone).date()
 
     try:
-        variable_dict = {}
-        variable_names_string = ''
-        with connection.cursor() as cursor_variable:
-            cursor_variable.execute(f'''
+        filepath = f'{settings.EXPORTED_DATA_CELERY_PATH}{file_id}.csv'
+        date_of_completion = datetime.utcnow()
+        # A single cursor is used for the variables and the data queries
+        with connection.cursor() as cursor, open(filepath, 'w') as f:
+            variable_dict = {}
+            variable_names_string = ''
+            cursor.execute(f'''
                 SELECT var.symbol
                     ,var.id
                     ,CASE WHEN unit.symbol IS NOT NULL THEN CONCAT(var.symbol, ' - ', var.name, ' (', unit.symbol, ')') 
@@ -879,90 +1073,83 @@ def export_data(station_id, source, start_date, end_date, variable_ids, file_id)
                 ORDER BY var.name
             ''', (variable_ids,))
 
-            rows = cursor_variable.fetchall()
+            rows = cursor.fetchall()
             for row in rows:
                 variable_dict[row[1]] = row[0]
                 variable_names_string += f'{row[2]}   '
 
-        # Iterate over the start and end date day by day to split the queries
-        datetime_list = [converted_start_date]
-        current_datetime = converted_start_date
-        while current_datetime < converted_end_date and (current_datetime + timedelta(days=1)) < converted_end_date:
-            current_datetime = current_datetime + timedelta(days=1)
-            datetime_list.append(current_datetime)
-        datetime_list.append(converted_end_date)
-
-        query_result = []
-        for i in range(0, len(datetime_list) - 1):
-            current_start_datetime = datetime_list[i]
-            current_end_datetime = datetime_list[i + 1]
-
-            with connection.cursor() as cursor:
-
-                if source == 'raw_data':
-                    cursor.execute(f'''
-                        WITH processed_data AS (
-                            SELECT datetime
-                                ,var.id as variable_id
-                                ,CASE WHEN var.variable_type ilike 'code' THEN data.code ELSE data.measured::varchar END AS value
-                            FROM raw_data data
-                            JOIN wx_variable var ON data.variable_id = var.id AND var.id IN %(variable_ids)s
-                            WHERE data.datetime >= %(start_datetime)s
-                            AND data.datetime < %(end_datetime)s
-                            AND data.station_id = %(station_id)s
-                        )
-                        SELECT (generated_time + interval '%(utc_offset)s minutes') at time zone 'utc' as datetime
-                            ,variable.id
-                            ,value
-                        FROM generate_series(%(start_datetime)s, %(end_datetime)s - INTERVAL '1 seconds', INTERVAL '%(data_interval)s seconds') generated_time
-                        JOIN wx_variable variable ON variable.id IN %(variable_ids)s
-                        LEFT JOIN processed_data ON datetime = generated_time AND variable.id = variable_id
-                    ''', {'utc_offset': station.utc_offset_minutes, 'variable_ids': variable_ids,
-                          'start_datetime': current_start_datetime, 'end_datetime': current_end_datetime,
-                          'station_id': station_id, 'data_interval': current_datafile.interval_in_seconds})
-                else:
-                    cursor.execute(f'''
-                        SELECT {date_source}, var.id, {measured_source}
-                        FROM {source} data
-                        JOIN wx_variable var ON data.variable_id = var.id AND var.id in %s
-                        WHERE data.{datetime_variable} >= %s 
-                        AND data.{datetime_variable} < %s
-                        AND data.station_id = %s
-                    ''', (variable_ids, current_start_datetime, current_end_datetime, station_id,))
-
-                query_result = query_result + cursor.fetchall()
-
-        filepath = f'{settings.EXPORTED_DATA_CELERY_PATH}{file_id}.csv'
-        date_of_completion = datetime.utcnow()
-        with open(filepath, 'w') as f:
-            start_date_header = start_date_utc.astimezone(timezone_offset).strftime('%Y-%m-%d %H:%M:%S')
-            end_date_header = end_date_utc.astimezone(timezone_offset).strftime('%Y-%m-%d %H:%M:%S')
-
-            f.write(f'Station:,{station.code} - {station.name}\n')
-            f.write(f'Data source:,{data_source_description}\n')
-            f.write(f'Description:,{variable_names_string}\n')
-            f.write(f'Latitude:,{station.latitude}\n')
-            f.write(f'Longitude:,{station.longitude}\n')
-            f.write(f'Date of completion:,{date_of_completion.strftime("%Y-%m-%d %H:%M:%S")}\n')
-            f.write(f'Prepared by:,{current_datafile.prepared_by}\n')
-            f.write(f'Start date:,{start_date_header},End date:,{end_date_header}\n\n')
-
-        lines = 0
-        if query_result:
-            df = pandas.DataFrame(data=query_result).pivot(index=0, columns=1)
-            df.rename(columns=variable_dict, inplace=True)
-            df.columns = df.columns.droplevel(0)
-
-            df['Year'] = df.index.map(lambda x: x.strftime('%Y'))
-            df['Month'] = df.index.map(lambda x: x.strftime('%m'))
-            df['Day'] = df.index.map(lambda x: x.strftime('%d'))
-            df['Time'] = df.index.map(lambda x: x.strftime('%H:%M:%S'))
-            cols = df.columns.tolist()
-            cols = cols[-4:] + cols[:-4]
-            df = df[cols]
-
-            df.to_csv(filepath, index=False, mode='a', header=True)
-            lines = len(df.index)
+            # The data is pivoted by the database in a single pass with FILTER aggregates rather than tablefunc
+            # crosstab, one column per variable in a fixed order by id
+            variable_columns = psycopg2.sql.SQL(', ').join(
+                psycopg2.sql.SQL('max(data_query.value) FILTER (WHERE data_query.variable_id = {}) AS {}').format(
+                    psycopg2.sql.Literal(variable_id), psycopg2.sql.Identifier(variable_dict[variable_id]))
+                for variable_id in sorted(variable_dict))
+
+            start_date_header = start_date_utc.astimezone(export_timezone).strftime(EXPORT_DATETIME_FORMAT)
+            end_date_header = end_date_utc.astimezone(export_timezone).strftime(EXPORT_DATETIME_FORMAT)
+
+            # Same line terminator as the COPY output, fields with commas are quoted
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerows([
+                ['Station:', f'{station.code} - {station.name}'],
+                ['Data source:', data_source_description],
+                ['Description:', variable_names_string],
+                ['Latitude:', station.latitude],
+                ['Longitude:', station.longitude],
+                ['Date of completion:', date_of_completion.strftime(EXPORT_DATETIME_FORMAT)],
+                ['Prepared by:', current_datafile.prepared_by],
+                ['Start date:', start_date_header, 'End date:', end_date_header],
+                [],
+            ])
+
+            if source == 'raw_data':
+                data_query = cursor.mogrify(f'''
+                    WITH processed_data AS (
+                        SELECT datetime
+                            ,var.id as variable_id
+                            ,CASE WHEN var.variable_type ilike 'code' THEN data.code ELSE data.measured::varchar END AS value
+                        FROM raw_data data
+                        JOIN wx_variable var ON data.variable_id = var.id AND var.id IN %(variable_ids)s
+                        WHERE data.datetime >= %(start_datetime)s
+                        AND data.datetime < %(end_datetime)s
+                        AND data.station_id = %(station_id)s
+                    )
+                    SELECT (generated_time + interval '%(utc_offset)s minutes') at time zone 'utc' as datetime
+                        ,variable.id
+                        ,value
+                    FROM generate_series(%(start_datetime)s, %(end_datetime)s - INTERVAL '1 seconds', INTERVAL '%(data_interval)s seconds') generated_time
+                    JOIN wx_variable variable ON variable.id IN %(variable_ids)s
+                    LEFT JOIN processed_data ON datetime = generated_time AND variable.id = variable_id
+                ''', {'utc_offset': station.utc_offset_minutes, 'variable_ids': variable_ids,
+                      'start_datetime': converted_start_date, 'end_datetime': converted_end_date,
+                      'station_id': station_id, 'data_interval': current_datafile.interval_in_seconds})
+            else:
+                data_query = cursor.mogrify(f'''
+                    SELECT {date_source}, var.id, {measured_source}
+                    FROM {source} data
+                    JOIN wx_variable var ON data.variable_id = var.id AND var.id in %s
+                    WHERE data.{datetime_variable} >= %s 
+                    AND data.{datetime_variable} < %s
+                    AND data.station_id = %s
+                ''', (variable_ids, converted_start_date, converted_end_date, station_id,))
+
+            # Rows are streamed by the database straight into the file
+            cursor.copy_expert(psycopg2.sql.SQL('''
+                COPY (
+                    SELECT to_char(data_query.datetime::timestamp, 'YYYY') AS "Year"
+                          ,to_char(data_query.datetime::timestamp, 'MM') AS "Month"
+                          ,to_char(data_query.datetime::timestamp, 'DD') AS "Day"
+                          ,to_char(data_query.datetime::timestamp, 'HH24:MI:SS') AS "Time"
+                          ,{variable_columns}
+                    FROM ({data_query}) AS data_query (datetime, variable_id, value)
+                    GROUP BY data_query.datetime
+                    ORDER BY data_query.datetime
+                ) TO STDOUT WITH CSV HEADER
+            ''').format(variable_columns=variable_columns,
+                        data_query=psycopg2.sql.SQL(data_query.decode())).as_string(cursor.cursor), f)
+
+            # COPY reports the data rows it wrote, the CSV header row is not included
+            lines = max(cursor.rowcount, 0)
 
         current_datafile.ready = True
         current_datafile.ready_at = date_of_completion
@@ -987,6 +1174,37 @@ def ftp_ingest_not_historical_station_files():
     ftp_ingest_station_files(False)
 
 
+FTP_BLOCKSIZE = 65536
+
+
+@lru_cache(maxsize=1024)
+def get_cron_expression(cron_schedule):
+    # Ingestion schedules rarely change, parse each one once per worker process
+    return cronex.CronExpression(cron_schedule)
+
+
+class FTPBinarySink:
+    """retrbinary callback writing the received blocks to a file and to its md5 hash"""
+    __slots__ = ('write', 'update')
+
+    def __init__(self, fp, hash_md5):
+        self.write = fp.write
+        self.update = hash_md5.update
+
+    def __call__(self, data):
+        self.write(data)
+        self.update(data)
+
+
+class FTPLineSink(FTPBinarySink):
+    """retrlines callback writing the received lines to a file and to its md5 hash"""
+    __slots__ = ()
+
+    def __call__(self, line):
+        self.write(line + '\n')
+        self.update(line.encode('utf8'))
+
+
 def ftp_ingest_station_files(historical_data):
     """
     Get and process station data files via FTP protocol
@@ -997,25 +1215,47 @@ def ftp_ingest_station_files(historical_data):
     """
     dt = datetime.now()
 
-    station_file_ingestions = StationFileIngestion.objects.filter(is_active=True, is_historical_data=historical_data)
+    station_file_ingestions = (StationFileIngestion.objects.select_related('ftp_server', 'decoder', 'station')
+                               .filter(is_active=True, is_historical_data=historical_data))
     station_file_ingestions = [s for s in station_file_ingestions if
-                               cronex.CronExpression(s.cron_schedule).check_trigger(
+                               get_cron_expression(s.cron_schedule).check_trigger(
                                    (dt.year, dt.month, dt.day, dt.hour, dt.minute))]
 
     # List of unique ftp servers
     ftp_servers = list(set([s.ftp_server for s in station_file_ingestions]))
 
-    # Loop over connecting to ftp servers, retrieving and processing files
-    for ftp_server in ftp_servers:
+    # Each ftp server is handled by its own thread and connection, the transfers are network bound
+    with ThreadPoolExecutor(max_workers=max(len(ftp_servers), 1)) as executor:
+        list(executor.map(
+            lambda ftp_server: ftp_ingest_server_files(
+                ftp_server, [s for s in station_file_ingestions if s.ftp_server == ftp_server], dt),
+            ftp_servers))
+
+    process_station_data_files(historical_data)
+
+
+def ftp_ingest_server_files(ftp_server, station_file_ingestions, dt):
+    """
+    Get the station data files of a single FTP server
+
+    Parameters:
+        ftp_server (FTPServer): server to connect to
+        station_file_ingestions (list): triggered StationFileIngestion objects of the server
+        dt (datetime): time the ingestion was triggered
+
+    """
+    try:
         logging.info(f'Connecting to {ftp_server}')
 
         with FTP() as ftp:
             ftp.connect(ftp_server.host, ftp_server.port)
+            # Control commands are small and sent one after the other, don't wait to coalesce them
+            ftp.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             ftp.login(ftp_server.username, ftp_server.password)
             ftp.set_pasv(not ftp_server.is_active_mode)
             home_folder = ftp.pwd()
 
-            for sfi in [s for s in station_file_ingestions if s.ftp_server == ftp_server]:
+            for sfi in station_file_ingestions:
                 try:
                     ftp.cwd(sfi.remote_folder)
                 except error_perm as e:
@@ -1025,6 +1265,8 @@ def ftp_ingest_station_files(historical_data):
                 # list remote files
                 remote_files = ftp.nlst(sfi.file_pattern)
 
+                station_data_files = []
+                pending_deletes = []
                 for fname in remote_files:
                     try:
                         local_folder = '/data/documents/ingest/%s/%s/%04d/%02d/%02d' % (
@@ -1037,46 +1279,69 @@ def ftp_ingest_station_files(historical_data):
                         hash_md5 = hashlib.md5()
                         if sfi.is_binary_transfer:
                             with open(local_path, 'wb') as fp_binary:
-                                ftp.retrbinary(f'RETR {fname}',
-                                               lambda data: [fp_binary.write(data), hash_md5.update(data)])
+                                ftp.retrbinary(f'RETR {fname}', FTPBinarySink(fp_binary, hash_md5),
+                                               blocksize=FTP_BLOCKSIZE)
                         else:
                             with open(local_path, 'w') as fp:
-                                ftp.retrlines(f'RETR {fname}', lambda line: [fp.write(line + '\n'),
-                                                                             hash_md5.update(line.encode('utf8'))])
-
-                        if sfi.delete_from_server:
-                            try:
-                                ftp.delete(fname)
-                            except error_perm as e:
-                                logger.error(
-                                    'Permission error on delete the ftp server file "{0}".'.format(local_path) + repr(
-                                        e))
-                                db_logger.error(
-                                    'Permission error on delete the ftp server file "{0}".'.format(local_path) + repr(
-                                        e))
-                            except error_reply as e:
-                                logger.error('Unknown reply received "{0}".'.format(local_path) + repr(e))
-                                db_logger.error('Unknown reply received "{0}".'.format(local_path) + repr(e))
+                                ftp.retrlines(f'RETR {fname}', FTPLineSink(fp, hash_md5))
 
                         # Inserts a StationDataFile object with status = 1 (Not processed)
-                        station_data_file = StationDataFile(station=sfi.station
-                                                            , decoder=sfi.decoder
-                                                            , status_id=1
-                                                            , utc_offset_minutes=sfi.utc_offset_minutes
-                                                            , filepath=local_path
-                                                            , file_hash=hash_md5.hexdigest()
-                                                            , file_size=os.path.getsize(local_path)
-                                                            , is_historical_data=sfi.is_historical_data
-                                                            , override_data_on_conflict=sfi.override_data_on_conflict)
-                        station_data_file.save()
+                        station_data_files.append(StationDataFile(station=sfi.station
+                                                                  , decoder=sfi.decoder
+                                                                  , status_id=1
+                                                                  , utc_offset_minutes=sfi.utc_offset_minutes
+                                                                  , filepath=local_path
+                                                                  , file_hash=hash_md5.hexdigest()
+                                                                  , file_size=os.path.getsize(local_path)
+                                                                  , is_historical_data=sfi.is_historical_data
+                                                                  , override_data_on_conflict=sfi.override_data_on_conflict))
                         logging.info(f'Downloaded FTP file: {local_path}')
+
+                        if sfi.delete_from_server:
+                            pending_deletes.append((fname, local_path))
                     except OSError as e:
                         logger.error('OS error. ' + repr(e))
                         db_logger.error('OS error. ' + repr(e))
 
+                StationDataFile.objects.bulk_create(station_data_files, batch_size=500)
+
+                # Files are deleted from the server after all of them are downloaded and registered
+                for fname, local_path in pending_deletes:
+                    try:
+                        ftp.delete(fname)
+                    except error_perm as e:
+                        logger.error('Permission error on delete the ftp server file "{0}".'.format(local_path) + repr(e))
+                        db_logger.error(
+                            'Permission error on delete the ftp server file "{0}".'.format(local_path) + repr(e))
+                    except error_reply as e:
+                        logger.error('Unknown reply received "{0}".'.format(local_path) + repr(e))
+                        db_logger.error('Unknown reply received "{0}".'.format(local_path) + repr(e))
+
                 ftp.cwd(home_folder)
+    finally:
+        connection.close()
 
-    process_station_data_files(historical_data)
+
+STATION_DATA_FILE_STATUS_BATCH_SIZE = 10
+
+
+def save_station_data_file_statuses(processed_ids, skipped_ids, error_files):
+    """
+    Save the final status of the handled station data files and empty the lists
+
+    Parameters:
+        processed_ids (list): ids of the files processed, status 3 (Processed)
+        skipped_ids (list): ids of the files already processed before, status 5 (Skipped)
+        error_files (list): StationDataFile objects with status 4 (Error) and their observation
+    """
+    with transaction.atomic():
+        StationDataFile.objects.filter(id__in=processed_ids).update(status_id=3, updated_at=timezone.now())
+        StationDataFile.objects.filter(id__in=skipped_ids).update(status_id=5, updated_at=timezone.now())
+        StationDataFile.objects.bulk_update(error_files, ['status_id', 'observation', 'updated_at'])
+
+    processed_ids.clear()
+    skipped_ids.clear()
+    error_files.clear()
 
 
 def process_station_data_files(historical_data=False, force_reprocess=False):
@@ -1101,81 +1366,111 @@ def process_station_data_files(historical_data=False, force_reprocess=False):
     # Filter status id to process only StationDataFiles with code 1 (Not processed) or 6 (Reprocess)
     station_data_file_list = (StationDataFile.objects.select_related('decoder', 'station')
                                   .filter(status_id__in=(1, 6), is_historical_data=historical_data).order_by('id')[:60])
-    logger.info('Station data files: %s' % station_data_file_list)
+    logger.info('Station data files: %s', [s.id for s in station_data_file_list])
 
     # Mark all file as Being processed to avoid reprocess
-    for station_data_file in station_data_file_list:
-        # Update status id to 2 (Being processed)
-        station_data_file.status_id = 2
-        station_data_file.save()
-
-    for station_data_file in station_data_file_list:
-        # if force_reprocess is true, ignore if file already exist on the database
-        if not force_reprocess:
-            # Verify if the file was already processed
-            # Check if exists some StationDataFilestatus
-            # object with the same file_hash and status different than 4 (Error) or 5 (Skipped)
-            file_already_processed = (StationDataFile.objects.filter(file_hash=station_data_file.file_hash)
-                                      .exclude(id=station_data_file.id).exclude(status_id__in=(4, 5)).exists())
-            if file_already_processed:
-                # Update status id to 5 (Skipped)
-                station_data_file.status_id = 5
-                station_data_file.save()
-                continue
-
-        try:
-            current_decoder = available_decoders[station_data_file.decoder.name]
-            logger.info('Processing file "{0}" with "{1}" decoder.'.format(station_data_file.filepath, current_decoder))
+    # Update status id to 2 (Being processed)
+    StationDataFile.objects.filter(id__in=[s.id for s in station_data_file_list]).update(status_id=2,
+                                                                                         updated_at=timezone.now())
+
+    # Status changes are saved every few files and when the task exits
+    processed_ids = []
+    skipped_ids = []
+    error_files = []
+    # Original status of the files not finished yet, they are given back if the task stops before them
+    pending_status_ids = {s.id: s.status_id for s in station_data_file_list}
+
+    # Hashes of files already processed, StationDataFile objects outside this
+    # batch with status different than 4 (Error) or 5 (Skipped)
+    processed_hashes = set(StationDataFile.objects.filter(file_hash__in=[s.file_hash for s in station_data_file_list])
+                           .exclude(id__in=[s.id for s in station_data_file_list])
+                           .exclude(status_id__in=(4, 5)).values_list('file_hash', flat=True))
 
-            current_decoder(filename=station_data_file.filepath
-                            , station_object=station_data_file.station
-                            , utc_offset=station_data_file.utc_offset_minutes
-                            , override_data_on_conflict=station_data_file.override_data_on_conflict)
+    try:
+        for station_data_file in station_data_file_list:
+            # if force_reprocess is true, ignore if file already exist on the database
+            if not force_reprocess:
+                # Verify if the file was already processed, here or by a previous file of this batch
+                if station_data_file.file_hash in processed_hashes:
+                    # Update status id to 5 (Skipped)
+                    del pending_status_ids[station_data_file.id]
+                    skipped_ids.append(station_data_file.id)
+                    continue
 
-        except Exception as err:
-            # Update status id to 4 (Error)
-            station_data_file.status_id = 4
-            station_data_file.observation = ('Error Processing file with "{0}" decoder. '
-                                             .format(current_decoder) + repr(err))[:1024]
-            station_data_file.save()
-
-            logger.error('Error Processing file "{0}" with "{1}" decoder. '
-                         .format(station_data_file.filepath, current_decoder) + repr(err))
-            db_logger.error('Error Processing file "{0}" with "{1}" decoder. '
-                            .format(station_data_file.filepath, current_decoder) + repr(err))
-        else:
-            # Update status id to 3 (Processed)
-            station_data_file.status_id = 3
-            station_data_file.save()
+            try:
+                current_decoder = available_decoders[station_data_file.decoder.name]
+                logger.info('Processing file "{0}" with "{1}" decoder.'.format(station_data_file.filepath,
+                                                                               current_decoder))
+
+                current_decoder(filename=station_data_file.filepath
+                                , station_object=station_data_file.station
+                                , utc_offset=station_data_file.utc_offset_minutes
+                                , override_data_on_conflict=station_data_file.override_data_on_conflict)
+
+            except Exception as err:
+                # Update status id to 4 (Error)
+                station_data_file.status_id = 4
+                station_data_file.updated_at = timezone.now()
+                station_data_file.observation = ('Error Processing file with "{0}" decoder. '
+                                                 .format(current_decoder) + repr(err))[:1024]
+                error_files.append(station_data_file)
+
+                logger.error('Error Processing file "{0}" with "{1}" decoder. '
+                             .format(station_data_file.filepath, current_decoder) + repr(err))
+                db_logger.error('Error Processing file "{0}" with "{1}" decoder. '
+                                .format(station_data_file.filepath, current_decoder) + repr(err))
+            else:
+                # Update status id to 3 (Processed)
+                processed_ids.append(station_data_file.id)
+                processed_hashes.add(station_data_file.file_hash)
+
+            del pending_status_ids[station_data_file.id]
+            if len(processed_ids) + len(skipped_ids) + len(error_files) >= STATION_DATA_FILE_STATUS_BATCH_SIZE:
+                save_station_data_file_statuses(processed_ids, skipped_ids, error_files)
+    finally:
+        save_station_data_file_statuses(processed_ids, skipped_ids, error_files)
+
+        # Files that were not finished go back to 1 (Not processed) or 6 (Reprocess)
+        for status_id in set(pending_status_ids.values()):
+            StationDataFile.objects.filter(id__in=[file_id for file_id, file_status_id in pending_status_ids.items()
+                                                   if file_status_id == status_id],
+                                           status_id=2).update(status_id=status_id, updated_at=timezone.now())
 
 
 @shared_task
 def process_hourly_summary_tasks():
     # process only 500 hourly summaries per execution
-    unprocessed_hourly_summary_datetimes = HourlySummaryTask.objects.filter(started_at=None).values_list('datetime',
-                                                                                                         flat=True).distinct()[
-                                           :501]
-    for hourly_summary_datetime in unprocessed_hourly_summary_datetimes:
+    unprocessed_hourly_summaries = (HourlySummaryTask.objects.filter(started_at=None).values('datetime')
+                                    .annotate(ids=ArrayAgg('id'), station_ids=ArrayAgg('station_id', distinct=True))
+                                    .order_by('datetime')[:501])
+
+    # Consecutive hours are summarized together in a single run
+    hourly_summary_runs = []
+    for hourly_summary in unprocessed_hourly_summaries:
+        if hourly_summary_runs and hourly_summary_runs[-1]['end_datetime'] == hourly_summary['datetime']:
+            current_run = hourly_summary_runs[-1]
+        else:
+            current_run = {'start_datetime': hourly_summary['datetime'], 'ids': [], 'station_ids': set()}
+            hourly_summary_runs.append(current_run)
 
-        start_datetime = hourly_summary_datetime
-        end_datetime = hourly_summary_datetime + timedelta(hours=1)
+        current_run['end_datetime'] = hourly_summary['datetime'] + timedelta(hours=1)
+        current_run['ids'].extend(hourly_summary['ids'])
+        current_run['station_ids'].update(hourly_summary['station_ids'])
 
-        hourly_summary_tasks = HourlySummaryTask.objects.filter(started_at=None, datetime=hourly_summary_datetime)
-        hourly_summary_tasks_ids = list(hourly_summary_tasks.values_list('id', flat=True))
-        station_ids = list(hourly_summary_tasks.values_list('station_id', flat=True).distinct())
+    HourlySummaryTask.objects.filter(id__in=[task_id for run in hourly_summary_runs for task_id in run['ids']]).update(
+        started_at=datetime.now(tz=pytz.UTC))
 
+    for run in hourly_summary_runs:
         try:
-            HourlySummaryTask.objects.filter(id__in=hourly_summary_tasks_ids).update(
-                started_at=datetime.now(tz=pytz.UTC))
-            calculate_hourly_summary(start_datetime, end_datetime, station_id_list=station_ids)
+            calculate_hourly_summary(run['start_datetime'], run['end_datetime'],
+                                     station_id_list=list(run['station_ids']))
         except Exception as err:
-            logger.error(
-                'Error calculation hourly summary for hour "{0}". '.format(hourly_summary_datetime) + repr(err))
-            db_logger.error(
-                'Error calculation hourly summary for hour "{0}". '.format(hourly_summary_datetime) + repr(err))
+            logger.error('Error calculation hourly summary for hours "{0}" - "{1}". '
+                         .format(run['start_datetime'], run['end_datetime']) + repr(err))
+            db_logger.error('Error calculation hourly summary for hours "{0}" - "{1}". '
+                            .format(run['start_datetime'], run['end_datetime']) + repr(err))
         else:
-            HourlySummaryTask.objects.filter(id__in=hourly_summary_tasks_ids).update(
-                finished_at=datetime.now(tz=pytz.UTC))
+            HourlySummaryTask.objects.filter(id__in=run['ids']).update(finished_at=datetime.now(tz=pytz.UTC))
 
 
 @shared_task
@@ -1189,13 +1484,16 @@ def process_daily_summary_tasks():
         start_date = daily_summary_date
         end_date = start_date + timedelta(days=1)
 
-        daily_summary_tasks = DailySummaryTask.objects.filter(started_at=None, date=daily_summary_date)
-        daily_summary_tasks_ids = list(daily_summary_tasks.values_list('id', flat=True))
-        station_ids = list(daily_summary_tasks.values_list('station_id', flat=True).distinct())
+        daily_summary_tasks = list(DailySummaryTask.objects.filter(started_at=None, date=daily_summary_date)
+                                   .values_list('id', 'station_id'))
+        daily_summary_tasks_ids = [task_id for task_id, _ in daily_summary_tasks]
+        station_ids = list({station_id for _, station_id in daily_summary_tasks})
 
         try:
             DailySummaryTask.objects.filter(id__in=daily_summary_tasks_ids).update(started_at=datetime.now(tz=pytz.UTC))
-            calculate_daily_summary(start_date, end_date, station_id_list=station_ids)
+            # Offsets are summarized here, so tasks are only finished once their summaries are saved
+            for offset, offset_station_ids in get_station_ids_by_offset(station_ids).items():
+                summarize_daily_offset(offset, offset_station_ids, start_date, end_date)
             # for station_id in station_ids:
             #    calculate_station_minimum_interval(start_date, end_date, station_id_list=(station_id,))
 
@@ -1205,12 +1503,33 @@ def process_daily_summary_tasks():
         else:
             DailySummaryTask.objects.filter(id__in=daily_summary_tasks_ids).update(
                 finished_at=datetime.now(tz=pytz.UTC))
+            cache.set('daily_summary_last_run', datetime.today(), None)
+
+
+# Keep-alive connections to HydroML are reused between predictions, only connection errors are retried
+_hydroml_session = requests.Session()
+_hydroml_session.mount(settings.HYDROML_URL, HTTPAdapter(pool_connections=4, pool_maxsize=8,
+                                                         max_retries=Retry(total=3, read=0, backoff_factor=0.5)))
+
+# Connect and read timeouts of the HydroML requests in seconds
+HYDROML_TIMEOUT = (5, 120)
+
+# The HydroML response and the result mapping are sent as jsonb and joined to raw_data in a single statement
+ML_FLAG_UPDATE_SQL = """
+    PREPARE ml_flag_update (jsonb, jsonb, integer, integer) AS
+    UPDATE raw_data 
+    SET ml_flag = mapping.value::integer
+    FROM jsonb_to_recordset($1) AS prediction (prediction text, datetime timestamp with time zone)
+    JOIN jsonb_each_text($2) AS mapping ON mapping.key = prediction.prediction
+    WHERE raw_data.station_id = $3
+      AND raw_data.variable_id = $4 
+      AND raw_data.datetime = prediction.datetime
+"""
 
 
 def predict_data(start_datetime, end_datetime, prediction_id, station_ids, target_station_id, variable_id,
                  data_period_in_minutes, interval_in_minutes, result_mapping):
     data_frequency = (interval_in_minutes // data_period_in_minutes) - 1
-    date_dict = {}
 
     logger.info(
         f"predict_data= start_datetime: {start_datetime}, end_datetime: {end_datetime}, station_ids: {station_ids}, variable_id: {variable_id}, data_period_in_minutes: {data_period_in_minutes}, interval_in_minutes: {interval_in_minutes}, data_frequency: {data_frequency}")
@@ -1225,66 +1544,39 @@ def predict_data(start_datetime, end_datetime, prediction_id, station_ids, targe
                              AND datetime   >= %(start_datetime)s
                              AND datetime   <= %(end_datetime)s
                              AND measured   != %(MISSING_VALUE)s)
+        -- Only datetimes that contain all stations measurements are kept
         SELECT acc_query.datetime
-              ,acc_query.station_id
-              ,acc_query.acc
+              ,AVG(acc_query.acc) AS avg
+              ,jsonb_object_agg(acc_query.station_id, acc_query.acc) AS stations
         FROM acc_query
-        WHERE acc_query.datetime - acc_query.earliest_datetime < INTERVAL '%(interval_in_minutes)s MINUTES';
+        WHERE acc_query.datetime - acc_query.earliest_datetime < INTERVAL '%(interval_in_minutes)s MINUTES'
+        GROUP BY acc_query.datetime
+        HAVING COUNT(acc_query.acc) = %(station_count)s
+        ORDER BY acc_query.datetime;
     """
 
     params = {
         "start_datetime": start_datetime,
         "end_datetime": end_datetime,
         "station_ids": station_ids,
+        "station_count": len(set(station_ids)),
         "variable_id": variable_id,
         "data_frequency": data_frequency,
         "interval_in_minutes": interval_in_minutes,
         "MISSING_VALUE": settings.MISSING_VALUE
     }
 
-    formated_list = []
-    conn = get_connection()
-    with conn.cursor() as cursor:
+    with get_connection() as conn, conn.cursor() as cursor:
         cursor.execute(query, params)
-
-        # Group records in a dictionary by datetime
-        # rows[0] = datetime
-        # rows[1] = station_id
-        # rows[2] = acc
-
         rows = cursor.fetchall()
-        if len(rows) == 0:
-            raise Exception('No data found')
-
-        for row in rows:
-            current_datetime = row[0]
-            current_station_id = row[1]
-            current_value = row[2]
-
-            if current_datetime not in date_dict:
-                date_dict[current_datetime] = {}
-
-            date_dict[current_datetime][current_station_id] = current_value
-
-        # Validate if a datetime contains all stations measurements, calculate avg and format value 
-        for datetime, station_data_dict in date_dict.items():
-
-            current_record_station_ids = tuple(station_data_dict.keys())
-            if any(station_id not in current_record_station_ids for station_id in station_ids):
-                continue
 
-            current_record_dict = {'datetime': datetime.isoformat()}
-            station_count = 0
-            value_acc = 0.0
+    if len(rows) == 0:
+        raise Exception('No data found')
 
-            for station_id, measured in station_data_dict.items():
-                current_record_dict[station_id] = measured
-                station_count += 1
-                value_acc += measured
-
-            if station_count > 0:
-                current_record_dict['avg'] = value_acc / station_count
-                formated_list.append(current_record_dict)
+    # rows[0] = datetime
+    # rows[1] = avg
+    # rows[2] = acc by station_id
+    formated_list = [{'datetime': row[0].isoformat(), **row[2], 'avg': row[1]} for row in rows]
 
     # Format output request data
     request_data = {
@@ -1294,72 +1586,105 @@ def predict_data(start_datetime, end_datetime, prediction_id, station_ids, targe
 
     logger.info(f'request_data: {repr(request_data)}')
 
-    request = requests.post(settings.HYDROML_URL, json=request_data)
+    request = _hydroml_session.post(settings.HYDROML_URL, json=request_data, timeout=HYDROML_TIMEOUT)
 
     if request.status_code != 200:
         logger.error(f'Error on predict data via HydroML, {request.status_code}')
         return
 
-    formated_response = []
-    response = json.loads(request.json())
+    # HydroML answers with the predictions json encoded as a string, it is also sent as is to the update
+    predictions = request.json()
+    response = json.loads(predictions)
 
-    # Format predicted values
-    for record in response:
-        try:
-            result = result_mapping[str(record['prediction'])]
-
-            formated_response.append({
-                "datetime": dateutil.parser.isoparse(record['datetime']),
-                "target_station_id": target_station_id,
-                "variable_id": variable_id,
-                "result": result,
-            })
-        except KeyError as e:
-            logger.error(
-                f'Error on predict_data for prediction "{prediction_id}": Invalid mapping for result "{record["prediction"]}".')
-            raise Exception(e)
+    if not response:
+        logger.info(f'No predictions returned by HydroML for prediction "{prediction_id}"')
+        return
+
+    # Unmapped results are reported once for the whole response, the update join skips their records
+    invalid_results = {str(record['prediction']) for record in response} - result_mapping.keys()
+    if invalid_results:
+        logger.error(
+            f'Error on predict_data for prediction "{prediction_id}": Invalid mapping for results {sorted(invalid_results)}.')
 
     # Update records' labels
     try:
-        with conn.cursor() as cursor:
-            cursor.executemany(f"""
-                UPDATE raw_data 
-                SET ml_flag = %(result)s
-                WHERE station_id = %(target_station_id)s
-                  AND variable_id = %(variable_id)s 
-                  AND datetime = %(datetime)s;
-            """, formated_response)
-        conn.commit()
+        with get_connection() as conn:
+            with conn, conn.cursor() as cursor:
+                prepare_statement(conn, 'ml_flag_update', ML_FLAG_UPDATE_SQL)
+                cursor.execute("EXECUTE ml_flag_update (%s, %s, %s, %s)",
+                               (predictions, Json(result_mapping), target_station_id, variable_id))
     except Exception as e:
         logger.error(f'Error on update raw_data: {repr(e)}')
 
 
+# Mappings are rarely changed by operators, they are shared between workers for a few minutes
+HYDROML_MAPPINGS_CACHE_TIMEOUT = 300
+
+
+def get_hydroml_prediction_mappings():
+    """
+    Get the quality flag of each prediction result, keyed by HydroML prediction
+
+    """
+    result_mappings = cache.get('hydroml_prediction_mappings')
+
+    if result_mappings is None:
+        result_mappings = defaultdict(dict)
+        for hydroml_prediction_id, prediction_result, quality_flag_id in HydroMLPredictionMapping.objects.values_list(
+                'hydroml_prediction_id', 'prediction_result', 'quality_flag_id'):
+            result_mappings[hydroml_prediction_id][prediction_result] = quality_flag_id
+
+        result_mappings = dict(result_mappings)
+        cache.set('hydroml_prediction_mappings', result_mappings, HYDROML_MAPPINGS_CACHE_TIMEOUT)
+
+    return result_mappings
+
+
 @shared_task
 def predict_preciptation_data():
-    hydroml_params = HydroMLPredictionStation.objects.all()
-
+    hydroml_params = (HydroMLPredictionStation.objects.select_related('prediction', 'neighborhood')
+                      .only('id', 'target_station', 'data_period_in_minutes', 'interval_in_minutes', 'prediction',
+                            'prediction__name', 'prediction__hydroml_prediction_id', 'prediction__variable',
+                            'neighborhood', 'neighborhood__id')
+                      .prefetch_related(Prefetch('neighborhood__neighborhood_stations',
+                                                 queryset=StationNeighborhood.objects.only('neighborhood_id',
+                                                                                           'station_id'))))
+
+    # Tasks receive the same prediction window as ISO strings
     end_datetime = datetime.utcnow()
-    start_datetime = end_datetime - timedelta(hours=2, minutes=30)
+    start_datetime = (end_datetime - timedelta(hours=2, minutes=30)).isoformat()
+    end_datetime = end_datetime.isoformat()
 
+    result_mappings = get_hydroml_prediction_mappings()
+
+    prediction_tasks = []
     for hydroml_param in hydroml_params:
         current_prediction = hydroml_param.prediction
         logger.info(f"Processing Prediction: {current_prediction.name}")
-        station_ids = tuple(hydroml_param.neighborhood.neighborhood_stations.all().values_list('station_id', flat=True))
-
-        result_mapping = {}
-        mappings = HydroMLPredictionMapping.objects.filter(hydroml_prediction_id=hydroml_param.id)
-        for mapping in mappings:
-            result_mapping[mapping.prediction_result] = mapping.quality_flag.id
-
-        try:
-            predict_data(start_datetime=start_datetime,
-                         end_datetime=end_datetime,
-                         prediction_id=current_prediction.hydroml_prediction_id,
-                         station_ids=station_ids,
-                         target_station_id=hydroml_param.target_station.id,
-                         variable_id=current_prediction.variable_id,
-                         data_period_in_minutes=hydroml_param.data_period_in_minutes,
-                         interval_in_minutes=hydroml_param.interval_in_minutes,
-                         result_mapping=result_mapping)
-        except Exception as e:
-            logger.error(f'Error on predict_preciptation_data for "{current_prediction.name}": {repr(e)}')
+        station_ids = [s.station_id for s in hydroml_param.neighborhood.neighborhood_stations.all()]
+
+        prediction_tasks.append(predict_station_data.s(prediction_name=current_prediction.name,
+                                                       start_datetime=start_datetime,
+                                                       end_datetime=end_datetime,
+                                                       prediction_id=current_prediction.hydroml_prediction_id,
+                                                       station_ids=station_ids,
+                                                       target_station_id=hydroml_param.target_station_id,
+                                                       variable_id=current_prediction.variable_id,
+                                                       data_period_in_minutes=hydroml_param.data_period_in_minutes,
+                                                       interval_in_minutes=hydroml_param.interval_in_minutes,
+                                                       result_mapping=result_mappings.get(hydroml_param.id, {})))
+
+    if prediction_tasks:
+        group(prediction_tasks).apply_async()
+
+
+# Limits leave room for the HydroML timeouts
+@shared_task(soft_time_limit=300, time_limit=360, acks_late=True)
+def predict_station_data(prediction_name, start_datetime, end_datetime, station_ids, **kwargs):
+    try:
+        predict_data(start_datetime=datetime.fromisoformat(start_datetime),
+                     end_datetime=datetime.fromisoformat(end_datetime),
+                     station_ids=tuple(station_ids),
+                     **kwargs)
+    except Exception as e:
+        logger.error(f'Error on predict_preciptation_data for "{prediction_name}": {repr(e)}')
@@ -1,13 +1,19 @@
+import struct
 from datetime import datetime
+from unittest.mock import MagicMock, patch
 
 import pytz
 from django.test import TestCase
 
+from wx.decoders import nesa
+from wx.decoders.flash import parse_data as parse_data_flash, read_data_batch as read_data_batch_flash
+
 from wx.decoders.hobo import parse_first_line_header as parse_first_line_header_hobo, \
     parse_second_line_header as parse_second_line_header_hobo, \
     convert_string_2_datetime as convert_string_2_datetime_hobo, get_column_names as get_column_names_hobo, \
     handle_null_field as handle_null_field_hobo
 from wx.decoders.toa5 import read_file, parse_first_line_header, parse_second_line_header, convert_string_2_datetime
+from wx.tasks import frame_entl_packets, process_received_data
 
 
 class IngestTOA5File(TestCase):
@@ -99,3 +105,110 @@ class IngestTOA5File(TestCase):
         self.assertEqual(handle_null_field_hobo('a'), None)
         self.assertEqual(handle_null_field_hobo('3.1'), 3.1)
         self.assertEqual(handle_null_field_hobo('0'), 0.0)
+
+
+class DecodeNesaMessage(TestCase):
+
+    dcp_address = 'DE3B2F02'
+
+    def read_data(self, response):
+        with patch.object(nesa, 'VariableFormat') as variable_format, \
+                patch.object(nesa, 'DcpMessages'), \
+                patch.object(nesa, 'insert') as insert:
+            variable_format.objects.filter.return_value.values_list.return_value = [('1', 900), ('2', 900)]
+            nesa.read_data(1, self.dcp_address, response, b'')
+
+        return insert
+
+    def test_read_data_multiple_transmissions(self):
+        response = (b'DE3B2F0221001120000G45+0NN123EFF00000 \r\n1100 12.5 0.2'
+                    b'DE3B2F0221001130000G45+0NN123EFF00000 \r\n1200 12.4 0.0')
+
+        insert = self.read_data(response)
+
+        insert.assert_called_once()
+        records = insert.call_args[0][0]
+        self.assertEqual(len(records), 4)
+        self.assertEqual([record[3] for record in records],
+                         [datetime(2021, 1, 1, 11, 0, tzinfo=pytz.UTC)] * 2 +
+                         [datetime(2021, 1, 1, 12, 0, tzinfo=pytz.UTC)] * 2)
+        self.assertEqual([record[4] for record in records], [12.5, 0.2, 12.4, 0.0])
+
+    def test_read_data_invalid_transmission(self):
+        response = (b'DE3B2F0221001120000G45+0NN123EFF00000 \r\n1100 12.5 0.2'
+                    b'DE3B2F0221001130000G45+0NN123EFF00000 \r\n1200 \xff\xfe 0.0')
+
+        insert = self.read_data(response)
+
+        insert.assert_called_once()
+        records = insert.call_args[0][0]
+        self.assertEqual([record[4] for record in records], [12.5, 0.2])
+
+    def test_read_data_invalid_response(self):
+        insert = self.read_data(b'DE3B2F02\xff\xfe')
+
+        insert.assert_not_called()
+
+
+class DecodeFlashData(TestCase):
+
+    @staticmethod
+    def build_packet(packet_type=56, latitude=17.25, longitude=-88.75):
+        return struct.pack('>BBIIiiiHBBBIIIiiiix', packet_type, 0, 1609459200, 500000000, int(latitude * 1e7),
+                           int(longitude * 1e7), -12000, 0, 7, 1, 2, 1609459200, 0, 250, 175000000, -890000000,
+                           170000000, -885000000)
+
+    def test_parse_data(self):
+        flash = parse_data_flash(self.build_packet())
+
+        self.assertIsNone(flash.pk)
+        self.assertEqual(flash.type, 'CG')
+        self.assertEqual(flash.datetime, datetime(2021, 1, 1, 0, 0, 0, 500000, tzinfo=pytz.UTC))
+        self.assertEqual(flash.latitude, 17.25)
+        self.assertEqual(flash.longitude, -88.75)
+        self.assertEqual(flash.peak_current, -12000)
+        self.assertEqual(flash.num_sensors, 7)
+        self.assertEqual(flash.duration, 250)
+        self.assertEqual(flash.lr_longitude, -88.5)
+
+    def test_parse_data_invalid_packet(self):
+        self.assertIsNone(parse_data_flash(self.build_packet(packet_type=0)))
+
+    def test_read_data_batch(self):
+        packets = [self.build_packet(), self.build_packet(packet_type=0), self.build_packet(latitude=16.5)]
+
+        with patch('wx.decoders.flash.Flash.objects.bulk_create') as bulk_create:
+            read_data_batch_flash(packets)
+
+        flashes = bulk_create.call_args[0][0]
+        self.assertEqual([flash.latitude for flash in flashes], [17.25, 16.5])
+
+
+class FrameEntlPackets(TestCase):
+
+    keep_alive = bytes([2, 9])
+
+    def test_frame_entl_packets_short_packet(self):
+        flash = DecodeFlashData.build_packet()
+        buffer = bytearray(self.keep_alive + flash + flash[:10])
+
+        self.assertEqual(frame_entl_packets(buffer), [self.keep_alive, flash])
+        self.assertEqual(bytes(buffer), flash[:10])
+
+    def test_frame_entl_packets_resync(self):
+        flash = DecodeFlashData.build_packet()
+        buffer = bytearray(bytes([0, 3]) + flash)
+
+        self.assertEqual(frame_entl_packets(buffer), [flash])
+        self.assertEqual(buffer, bytearray())
+
+    def test_process_received_data(self):
+        flash = DecodeFlashData.build_packet()
+        entl_socket = MagicMock()
+        entl_socket.recv.side_effect = [self.keep_alive + flash[:20], flash[20:] + flash[:1], flash[1:], b'']
+
+        with patch('wx.tasks.save_flash_data_batch') as save_flash_data_batch:
+            process_received_data(entl_socket)
+
+        flashes = [data_string for call in save_flash_data_batch.delay.call_args_list for data_string in call[0][0]]
+        self.assertEqual(flashes, [flash.decode('latin-1')] * 2)